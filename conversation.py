@@ -25,6 +25,10 @@ class ConversationManager:
         """Add a message to the conversation"""
         return MongoDBConversationManager.add_message(conversation_id, message)
     
+    def add_messages(self, conversation_id: str, messages: List[Dict[str, Any]]) -> bool:
+        """Add several messages to the conversation with a single insert"""
+        return MongoDBConversationManager.add_messages(conversation_id, messages)
+    
     def get_conversation_history(self, conversation_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get the conversation history"""
         return MongoDBConversationManager.get_conversation_history(conversation_id, limit)
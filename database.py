@@ -1,12 +1,16 @@
 import os
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 import json
+import logging
 from bson import ObjectId
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
@@ -57,7 +61,7 @@ except Exception as e:
             self.data.append(doc)
             return type('obj', (object,), {'inserted_id': len(self.data)})
         
-        def insert_many(self, docs):
+        def insert_many(self, docs, ordered=True):
             for doc in docs:
                 self.insert_one(doc)
         
@@ -111,6 +115,23 @@ except Exception as e:
             # If we get here, no document was updated
             return type('obj', (object,), {'modified_count': 0})
         
+        def find_one_and_update(self, query, update, upsert=False, return_document=False, projection=None):
+            doc = self.find_one(query)
+            before = dict(doc) if doc else None
+            if doc is None:
+                if not upsert:
+                    return None
+                doc = {**query, **update.get("$setOnInsert", {})}
+                self.data.append(doc)
+            for k, v in update.get("$set", {}).items():
+                doc[k] = v
+            for k, v in update.get("$inc", {}).items():
+                doc[k] = doc.get(k, 0) + v
+            for k, v in update.get("$push", {}).items():
+                doc.setdefault(k, []).append(v)
+            # return_document is ReturnDocument.AFTER (True) or BEFORE (False)
+            return doc if return_document else before
+        
         def count_documents(self, query):
             count = 0
             for doc in self.data:
@@ -131,8 +152,25 @@ except Exception as e:
         def __init__(self, data):
             self.data = data
         
-        def sort(self, field, direction):
-            # Mock implementation, doesn't actually sort
+        def sort(self, key_or_list, direction=None):
+            keys = key_or_list if isinstance(key_or_list, list) else [(key_or_list, direction)]
+            # Documents without an _id order by insertion, as ObjectIds would
+            position = {id(doc): i for i, doc in enumerate(self.data)}
+            # Stable sorts applied from the last key to the first give a multi-key sort
+            for field, field_direction in reversed(keys):
+                if field == "_id":
+                    key = lambda doc: doc.get("_id", position[id(doc)])
+                else:
+                    key = lambda doc, field=field: doc.get(field)
+                self.data = sorted(self.data, key=key, reverse=field_direction < 0)
+            return self
+        
+        def skip(self, count):
+            self.data = self.data[count:]
+            return self
+        
+        def limit(self, count):
+            self.data = self.data[:count]
             return self
         
         def __iter__(self):
@@ -150,9 +188,38 @@ conversations_collection = db["conversations"]
 messages_collection = db["messages"]
 users_collection = db["users"]
 
-# Ensure indexes for performance
-conversations_collection.create_index("conversation_id", unique=True)
-messages_collection.create_index("conversation_id")
+# (collection, field) pairs whose unique index is known to be in place; the in-memory fallback
+# store enforces no indexes, so nothing is recorded for it
+_unique_indexes = set()
+
+def has_unique_index(collection_name: str, field: str) -> bool:
+    """Whether duplicate values of field are rejected by a unique index built at startup"""
+    return (collection_name, field) in _unique_indexes
+
+def _create_unique_index(collection, field):
+    """Create a unique index on field, falling back to a plain index if it can't be built"""
+    try:
+        collection.create_index(field, unique=True)
+    except OperationFailure:
+        # Existing duplicates keep the unique index from building; the lookups still need an index
+        logger.warning(
+            "Could not create unique index on %s.%s, creating a non-unique one", collection.name, field, exc_info=True
+        )
+        collection.create_index(field)
+        return
+    if client is not None:
+        _unique_indexes.add((collection.name, field))
+
+def ensure_indexes():
+    """Create the indexes behind the conversation and history queries; a no-op when they already exist"""
+    _create_unique_index(conversations_collection, "conversation_id")
+    # Conversation list: a user's conversations, most recently updated first
+    conversations_collection.create_index([("user_id", 1), ("updated_at", -1)])
+    # History window: a conversation's messages, newest first, in the order get_conversation_history sorts them
+    messages_collection.create_index([("conversation_id", 1), ("timestamp", -1), ("_id", -1)])
+    # Settings and account lookups by user ID, email and username; each is unique per user
+    for collection, field in ((db["user_settings"], "user_id"), (db["app_users"], "email"), (db["app_users"], "username")):
+        _create_unique_index(collection, field)
 
 # Hardcoded user for now
 def ensure_hardcoded_user_exists():
@@ -172,15 +239,16 @@ def initialize_db():
 # Conversation operations
 class MongoDBConversationManager:
     @staticmethod
-    def create_conversation(conversation_id: str, title: str, description: str, user_id: str = "default_user") -> str:
-        """Create a new conversation in MongoDB"""
-        conversation = {
+    def new_conversation(conversation_id: str, title: str, description: str, user_id: str = "default_user") -> Dict[str, Any]:
+        """Build the document for a new conversation"""
+        now = datetime.now()
+        return {
             "conversation_id": conversation_id,
             "user_id": user_id,
             "title": title,
             "description": description,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now(),
+            "created_at": now,
+            "updated_at": now,
             "state": {
                 "current_topic": None,
                 "difficulty_level": "medium",
@@ -189,6 +257,11 @@ class MongoDBConversationManager:
                 "question_history": []
             }
         }
+    
+    @staticmethod
+    def create_conversation(conversation_id: str, title: str, description: str, user_id: str = "default_user") -> str:
+        """Create a new conversation in MongoDB"""
+        conversation = MongoDBConversationManager.new_conversation(conversation_id, title, description, user_id)
         
         # Insert the conversation document
         conversations_collection.insert_one(conversation)
@@ -198,34 +271,118 @@ class MongoDBConversationManager:
     @staticmethod
     def add_message(conversation_id: str, message: Dict[str, Any]) -> bool:
         """Add a message to the conversation"""
+        return MongoDBConversationManager.add_messages(conversation_id, [message])
+    
+    @staticmethod
+    def add_messages(conversation_id: str, messages: List[Dict[str, Any]]) -> bool:
+        """Add several messages to the conversation with a single insert"""
+        if not messages:
+            return True
+        
+        now = datetime.now()
+        
         # Update conversation updated_at time
         conversations_collection.update_one(
             {"conversation_id": conversation_id},
-            {"$set": {"updated_at": datetime.now()}}
+            {"$set": {"updated_at": now}}
         )
         
-        # Add the message
-        message_doc = {
-            "conversation_id": conversation_id,
-            "timestamp": datetime.now(),
-            **message
-        }
-        
-        messages_collection.insert_one(message_doc)
+        # Add all messages in one round-trip, preserving their order
+        messages_collection.insert_many([
+            {
+                "conversation_id": conversation_id,
+                "timestamp": now,
+                **message
+            }
+            for message in messages
+        ])
         return True
     
     @staticmethod
     def get_conversation_history(conversation_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get the conversation history for a specific conversation"""
-        # Find messages for the conversation, sorted by timestamp
+        # Fetch only the most recent messages, newest first; messages stored together share
+        # a timestamp, so _id (which increases with insertion order) breaks the tie
         messages = list(messages_collection.find(
             {"conversation_id": conversation_id},
             {"_id": 0}  # Exclude MongoDB _id
-        ).sort("timestamp", 1))  # Sort by timestamp ascending
+        ).sort([("timestamp", -1), ("_id", -1)]).limit(limit))
         
-        # Return the most recent messages up to the limit
-        return messages[-limit:] if len(messages) > limit else messages
+        # Return them in chronological order
+        messages.reverse()
+        return messages
     
+    @staticmethod
+    def get_conversation_with_history(conversation_id: str, limit: int = 50) -> Optional[Dict[str, Any]]:
+        """Get a conversation with its most recent messages under "messages", in one round-trip"""
+        if client is None:
+            # The in-memory fallback store has no aggregation support
+            conversation = MongoDBConversationManager.get_conversation(conversation_id)
+            if conversation:
+                conversation = {
+                    **conversation,
+                    "messages": MongoDBConversationManager.get_conversation_history(conversation_id, limit)
+                }
+            return conversation
+
+        results = list(conversations_collection.aggregate([
+            {"$match": {"conversation_id": conversation_id}},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": messages_collection.name,
+                "localField": "conversation_id",
+                "foreignField": "conversation_id",
+                "as": "messages",
+                # Same ordering as get_conversation_history
+                "pipeline": [
+                    {"$sort": {"timestamp": -1, "_id": -1}},
+                    {"$limit": limit},
+                    {"$project": {"_id": 0}}
+                ]
+            }},
+            {"$project": {"_id": 0}}
+        ]))
+        if not results:
+            return None
+
+        # Return the messages in chronological order
+        conversation = results[0]
+        conversation["messages"].reverse()
+        return conversation
+
+    @staticmethod
+    def get_messages(conversation_id: str, skip: int, limit: int) -> List[Dict[str, Any]]:
+        """Get limit messages of a conversation in chronological order, after skipping the first skip"""
+        return list(messages_collection.find(
+            {"conversation_id": conversation_id},
+            {"_id": 0}
+        ).sort([("timestamp", 1), ("_id", 1)]).skip(skip).limit(limit))
+
+    @staticmethod
+    def count_messages(conversation_id: str) -> int:
+        """Count the messages stored for a conversation"""
+        return messages_collection.count_documents({"conversation_id": conversation_id})
+
+    @staticmethod
+    def get_rolling_summary(conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Get the summary of older messages and how many messages it covers, if one was stored"""
+        conversation = conversations_collection.find_one(
+            {"conversation_id": conversation_id},
+            {"rolling_summary": 1, "_id": 0}
+        )
+
+        return conversation.get("rolling_summary") if conversation else None
+
+    @staticmethod
+    def update_rolling_summary(conversation_id: str, summary: str, summarized_count: int) -> bool:
+        """Store the summary of the first summarized_count messages of a conversation"""
+        result = conversations_collection.update_one(
+            {"conversation_id": conversation_id},
+            {"$set": {"rolling_summary": {"summary": summary, "summarized_count": summarized_count}}}
+        )
+
+        return result.modified_count > 0
+
     @staticmethod
     def get_conversation(conversation_id: str) -> Optional[Dict[str, Any]]:
         """Get a conversation by ID"""
@@ -265,51 +422,41 @@ class MongoDBConversationManager:
     def record_answer_result(conversation_id: str, question_id: str, 
                            was_correct: bool, user_answer: Any, difficulty: str) -> bool:
         """Record the result of a user answering a question"""
+        now = datetime.now()
+        
         # Create question result document
         question_result = {
             "question_id": question_id,
-            "timestamp": datetime.now(),
+            "timestamp": now,
             "was_correct": was_correct,
             "user_answer": user_answer,
             "difficulty": difficulty
         }
         
-        # Get current state
-        state = MongoDBConversationManager.get_state(conversation_id)
-        if not state:
-            return False
-        
-        # Update counts
-        correct_answers = state.get("correct_answers", 0)
-        incorrect_answers = state.get("incorrect_answers", 0)
-        
-        if was_correct:
-            correct_answers += 1
-        else:
-            incorrect_answers += 1
-        
-        # Add question to history and update counts
-        result = conversations_collection.update_one(
+        # Count the answer and add it to the history in one round-trip, getting the updated state back
+        conversation = conversations_collection.find_one_and_update(
             {"conversation_id": conversation_id},
             {
-                "$set": {
-                    "updated_at": datetime.now(),
-                    "state.correct_answers": correct_answers,
-                    "state.incorrect_answers": incorrect_answers
-                },
+                "$set": {"updated_at": now},
+                "$inc": {"state.correct_answers" if was_correct else "state.incorrect_answers": 1},
                 "$push": {"state.question_history": question_result}
-            }
+            },
+            projection={"state": 1, "_id": 0},
+            return_document=ReturnDocument.AFTER
         )
+        if not conversation or not conversation.get("state"):
+            return False
         
-        # Adapt difficulty based on performance
-        MongoDBConversationManager._adapt_difficulty(conversation_id)
+        # Adapt difficulty based on performance, from the state just returned
+        MongoDBConversationManager._adapt_difficulty(conversation_id, conversation["state"])
         
-        return result.modified_count > 0
+        return True
     
     @staticmethod
-    def _adapt_difficulty(conversation_id: str) -> None:
+    def _adapt_difficulty(conversation_id: str, state: Optional[Dict[str, Any]] = None) -> None:
         """Adapt the difficulty level based on user performance"""
-        state = MongoDBConversationManager.get_state(conversation_id)
+        if state is None:
+            state = MongoDBConversationManager.get_state(conversation_id)
         if not state:
             return
         
@@ -1,9 +1,18 @@
 from fastapi import HTTPException, Depends, Header, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordBearer
 from jose import JWTError, jwt
+from bson import ObjectId
 from typing import Optional
+import aiohttp
+import asyncio
+import logging
+import orjson
 import os
 
+from database import db
+
+logger = logging.getLogger(__name__)
+
 # JWT configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7")
 ALGORITHM = "HS256"
@@ -14,14 +23,45 @@ security_scheme = HTTPBearer(
     auto_error=False
 )
 
+# One HTTP session for all OpenAI and CMS calls, so connections (and their TLS handshakes) are reused.
+# aiohttp's default is a 5 minute total timeout, long enough for one hung call to hold a request
+# (and every caller coalesced onto it) open, so calls give up much sooner: a whole response must
+# arrive within HTTP_TIMEOUT.
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=90, connect=10, sock_read=60)
+# A streamed completion may legitimately run longer overall, but each chunk must follow the last promptly
+HTTP_STREAM_TIMEOUT = aiohttp.ClientTimeout(total=300, connect=10, sock_read=30)
+
+_http_session: Optional[aiohttp.ClientSession] = None
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared aiohttp session, creating it on first use inside the running event loop"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(timeout=HTTP_TIMEOUT)
+    return _http_session
+
+async def close_http_session():
+    """Close the shared aiohttp session; called on application shutdown"""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+def _log_usage(model, usage):
+    """Log a completion's token usage, including how much of the prompt OpenAI served from its prefix cache"""
+    if not usage:
+        return
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    logger.debug(
+        "OpenAI usage for %s: %s prompt tokens (%s cached), %s completion tokens",
+        model, usage.get("prompt_tokens"), cached_tokens, usage.get("completion_tokens")
+    )
+
 # Create a safe OpenAI client function with proper error handling
-async def create_openai_completion(messages, model="gpt-3.5-turbo"):
+async def create_openai_completion(messages, model="gpt-3.5-turbo", max_tokens=None, temperature=None, response_format=None):
     """Helper function to create OpenAI chat completions without proxy issues"""
     try:
         # Use direct HTTP requests instead of the OpenAI client
-        import aiohttp
-        import json
-        
         api_key = os.getenv("OPENAI_API_KEY")
         headers = {
             "Content-Type": "application/json",
@@ -32,55 +72,137 @@ async def create_openai_completion(messages, model="gpt-3.5-turbo"):
             "model": model,
             "messages": messages
         }
+        # Only send the optional limits when given, so the API defaults apply otherwise
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        if temperature is not None:
+            payload["temperature"] = temperature
+        if response_format is not None:
+            payload["response_format"] = response_format
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=payload
-            ) as response:
-                result = await response.json()
+        # The body, few-shot examples included, is encoded with orjson rather than aiohttp's json.dumps
+        session = get_http_session()
+        async with session.post(
+            "https://api.openai.com/v1/chat/completions",
+            headers=headers,
+            data=orjson.dumps(payload)
+        ) as response:
+            result = await response.json()
+            _log_usage(model, result.get("usage"))
+            
+            # Create response object that mimics the OpenAI client response
+            if "choices" in result and len(result["choices"]) > 0:
+                content = result["choices"][0]["message"]["content"]
                 
-                # Create response object that mimics the OpenAI client response
-                if "choices" in result and len(result["choices"]) > 0:
-                    content = result["choices"][0]["message"]["content"]
-                    
-                    # Create a dummy message object
-                    class Message:
-                        def __init__(self, content):
-                            self.content = content
-                    
-                    # Create a dummy choice object
-                    class Choice:
-                        def __init__(self, message):
-                            self.message = message
-                    
-                    # Create a dummy response object
-                    class Response:
-                        def __init__(self, choices):
-                            self.choices = choices
-                    
-                    # Create and return the response
-                    message = Message(content)
-                    choice = Choice(message)
-                    return Response([choice])
-                else:
-                    raise Exception(f"Unexpected response format: {result}")
+                # Create a dummy message object
+                class Message:
+                    def __init__(self, content):
+                        self.content = content
+                
+                # Create a dummy choice object
+                class Choice:
+                    def __init__(self, message):
+                        self.message = message
+                
+                # Create a dummy response object
+                class Response:
+                    def __init__(self, choices):
+                        self.choices = choices
+                
+                # Create and return the response
+                message = Message(content)
+                choice = Choice(message)
+                return Response([choice])
+            else:
+                raise Exception(f"Unexpected response format: {result}")
     except Exception as e:
-        print(f"OpenAI API error: {str(e)}")
+        logger.error("OpenAI API error: %s", e)
         # Return a dummy response object for graceful fallback
         class DummyChoice:
             def __init__(self):
                 self.message = type('obj', (object,), {
-                    'content': f"I couldn't process your request due to a technical issue: {str(e)[:100]}..."
+                    'content': openai_error_text(e)
                 })
         
         class DummyResponse:
             def __init__(self):
                 self.choices = [DummyChoice()]
+                self.error = str(e)
         
         return DummyResponse()
 
+# Start of every reply shown in place of a failed OpenAI call
+OPENAI_ERROR_PREFIX = "I couldn't process your request due to a technical issue"
+
+def openai_error_text(error):
+    """Reply shown to the user when an OpenAI call fails"""
+    return f"{OPENAI_ERROR_PREFIX}: {str(error)[:100]}..."
+
+async def iter_openai_completion(messages, model="gpt-3.5-turbo", max_tokens=None, temperature=None):
+    """Yield the content of an OpenAI chat completion piece by piece as it is generated, raising on errors"""
+    api_key = os.getenv("OPENAI_API_KEY")
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        # Ask for a final chunk carrying token usage, so cached prompt tokens are logged for streams too
+        "stream_options": {"include_usage": True}
+    }
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+    if temperature is not None:
+        payload["temperature"] = temperature
+    
+    session = get_http_session()
+    async with session.post(
+        "https://api.openai.com/v1/chat/completions",
+        headers=headers,
+        data=orjson.dumps(payload),
+        timeout=HTTP_STREAM_TIMEOUT
+    ) as response:
+        if response.status != 200:
+            raise Exception(f"OpenAI API returned {response.status}: {await response.text()}")
+        
+        # The API sends server-sent events, one "data: {...}" line per chunk
+        async for line in response.content:
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            
+            chunk = orjson.loads(data)
+            _log_usage(model, chunk.get("usage"))
+            if chunk.get("choices"):
+                content = chunk["choices"][0].get("delta", {}).get("content")
+                if content:
+                    yield content
+
+async def stream_openai_completion(messages, model="gpt-3.5-turbo", on_complete=None):
+    """Yield the content of an OpenAI chat completion piece by piece as it is generated.
+
+    on_complete is called with the full text only when the stream finishes cleanly, so callers can
+    tell a complete reply from one that failed partway and ends in the fallback text.
+    """
+    parts = []
+    try:
+        async for content in iter_openai_completion(messages, model=model):
+            parts.append(content)
+            yield content
+    except Exception as e:
+        logger.error("OpenAI API streaming error: %s", e)
+        # Finish with the same graceful fallback text as create_openai_completion
+        yield openai_error_text(e)
+        return
+    if on_complete:
+        on_complete("".join(parts))
+
 # Updated get_current_user to use the security scheme
 async def get_current_user(
     request: Request,
@@ -98,7 +220,7 @@ async def get_current_user(
         token = credentials.credentials
     # Otherwise try the Authorization header
     elif authorization:
-        print(f"Authorization header found: {authorization}")
+        logger.debug("Authorization header found")
         try:
             scheme, token_value = authorization.split()
             if scheme.lower() != "bearer":
@@ -110,14 +232,14 @@ async def get_current_user(
         # Check for token in query parameters as fallback
         token_param = request.query_params.get("token")
         if token_param:
-            print(f"Token found in query parameter: {token_param[:10]}...")
+            logger.debug("Token found in query parameter: %.10s...", token_param)
             token = token_param
     
     # If still no token, check for cookie
     if not token:
         access_token = request.cookies.get("access_token")
         if access_token:
-            print(f"Token found in cookie: {access_token[:10]}...")
+            logger.debug("Token found in cookie: %.10s...", access_token)
             token = access_token
     
     if not token:
@@ -127,29 +249,26 @@ async def get_current_user(
         )
     
     try:
-        print(f"Token: {token}")
         # Decode JWT token
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("user_id")
-        print(f"User ID: {user_id}")
+        logger.debug("User ID: %s", user_id)
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token: missing user_id")
         
-        # Get user from database
-        from database import db
+        # Get user from database; PyMongo is synchronous, so query from a worker thread
         # Try to find user by string ID first
-        user = db.app_users.find_one({"_id": user_id})
+        user = await asyncio.to_thread(db.app_users.find_one, {"_id": user_id})
         
         # If not found, try other possible formats
         if user is None:
             # Try to find by string representation of ID
             try:
-                from bson import ObjectId
                 # Check if the user_id is a valid ObjectId
                 if ObjectId.is_valid(user_id):
-                    user = db.app_users.find_one({"_id": ObjectId(user_id)})
+                    user = await asyncio.to_thread(db.app_users.find_one, {"_id": ObjectId(user_id)})
             except Exception as e:
-                print(f"Error converting to ObjectId: {str(e)}")
+                logger.warning("Error converting to ObjectId: %s", e)
         
         if user is None:
             raise HTTPException(status_code=404, detail=f"User not found with ID: {user_id}")
@@ -158,17 +277,12 @@ async def get_current_user(
     except JWTError as e:
         raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Authentication error: {str(e)}\n{error_details}")
+        logger.exception("Authentication error: %s", e)
         raise HTTPException(status_code=401, detail=f"Authentication error: {str(e)}")
 
 async def fetch_prompt_from_cms(topic_ids: str):
     """Fetch prompt from CMS based on topic IDs"""
     try:
-        import aiohttp
-        import json
-
         cms_base_url = os.getenv("CMS_BASE_URL", "http://localhost:3000/api")
         
         # Ensure cms_base_url doesn't end with a slash
@@ -176,46 +290,45 @@ async def fetch_prompt_from_cms(topic_ids: str):
             cms_base_url = cms_base_url[:-1]
             
         complete_url = f"{cms_base_url}/get-prompt"
-        print(f"Fetching prompt from CMS for topic_ids: {topic_ids}")
-        print(f"Complete CMS URL: {complete_url}")
+        logger.debug("Fetching prompt from CMS for topic_ids: %s", topic_ids)
+        logger.debug("Complete CMS URL: %s", complete_url)
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(complete_url, params={"topicIds": topic_ids}) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    print(f"CMS Response: {data}")
-                    
-                    # Make sure we properly extract the data from the CMS response structure
-                    if data.get('success') and data.get('data'):
-                        return {
-                            'success': True,
-                            'data': {
-                                'id': data['data'].get('id', ''),
-                                'name': data['data'].get('name', 'Portuguese language'),
-                                'description': data['data'].get('description', ''),
-                                'prompt': data['data'].get('prompt', ''),
-                                'examples': data['data'].get('examples', [])
-                            }
-                        }
-                    else:
-                        print(f"Warning: CMS response missing expected structure: {data}")
-                        return {
-                            'success': False,
-                            'data': {
-                                'name': 'Portuguese language',
-                                'prompt': ''
-                            }
+        session = get_http_session()
+        async with session.get(complete_url, params={"topicIds": topic_ids}) as response:
+            if response.status == 200:
+                data = await response.json()
+                logger.debug("CMS Response: %s", data)
+                
+                # Make sure we properly extract the data from the CMS response structure
+                if data.get('success') and data.get('data'):
+                    return {
+                        'success': True,
+                        'data': {
+                            'id': data['data'].get('id', ''),
+                            'name': data['data'].get('name', 'Portuguese language'),
+                            'description': data['data'].get('description', ''),
+                            'prompt': data['data'].get('prompt', ''),
+                            'examples': data['data'].get('examples', [])
                         }
+                    }
                 else:
-                    error_text = await response.text()
-                    print(f"CMS API error (status {response.status}): {error_text}")
-                    raise HTTPException(
-                        status_code=response.status,
-                        detail=f"Error from CMS API: {error_text}"
-                    )
+                    logger.warning("CMS response missing expected structure: %s", data)
+                    return {
+                        'success': False,
+                        'data': {
+                            'name': 'Portuguese language',
+                            'prompt': ''
+                        }
+                    }
+            else:
+                error_text = await response.text()
+                logger.error("CMS API error (status %s): %s", response.status, error_text)
+                raise HTTPException(
+                    status_code=response.status,
+                    detail=f"Error from CMS API: {error_text}"
+                )
     except aiohttp.ClientConnectorError as e:
-        print(f"Connection error to CMS API: {str(e)}")
-        print(f"Attempted URL: {cms_base_url}/get-prompt")
+        logger.error("Connection error to CMS API at %s/get-prompt: %s", cms_base_url, e)
         return {
             'success': False,
             'data': {
@@ -224,10 +337,7 @@ async def fetch_prompt_from_cms(topic_ids: str):
             }
         }
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error fetching prompt from CMS: {str(e)}")
-        print(f"Error details: {error_details}")
+        logger.exception("Error fetching prompt from CMS: %s", e)
         return {
             'success': False,
             'data': {
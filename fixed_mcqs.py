@@ -3,6 +3,7 @@ import uuid
 from pydantic import BaseModel
 from enum import Enum
 from typing import List, Optional
+import itertools
 import random
 
 # Define the models we need
@@ -32,6 +33,76 @@ class McqsRequest(BaseModel):
     difficulty: Optional[str] = "medium"
     num_questions: Optional[int] = 5
 
+# Predefined questions about Portuguese nouns (always have at least 7 questions)
+PREDEFINED_QUESTIONS = [
+    {
+        "type": QuestionTypes.MULTIPLE_CHOICE,
+        "questionText": "Which Portuguese noun is feminine?",
+        "questionDescription": "Select the noun that is feminine in Portuguese.",
+        "options": ["casa (house)", "livro (book)", "carro (car)", "telefone (telephone)"],
+        "correct_answers": ["casa (house)"],
+        "hint": "Nouns ending in 'a' are typically feminine in Portuguese."
+    },
+    {
+        "type": QuestionTypes.MULTIPLE_CHOICE,
+        "questionText": "What is the correct article to use with the Portuguese noun 'livro'?",
+        "questionDescription": "Choose the appropriate definite article.",
+        "options": ["o", "a", "os", "as"],
+        "correct_answers": ["o"],
+        "hint": "Masculine singular nouns use 'o' as their definite article."
+    },
+    {
+        "type": QuestionTypes.MULTIPLE_CHOICE,
+        "questionText": "What is the plural form of the Portuguese noun 'mulher'?",
+        "questionDescription": "Select the correct plural form.",
+        "options": ["mulheres", "mulhers", "mulheris", "mulher"],
+        "correct_answers": ["mulheres"],
+        "hint": "Many Portuguese nouns add 'es' to form the plural."
+    },
+    {
+        "type": QuestionTypes.MULTIPLE_CHOICE,
+        "questionText": "Which of these Portuguese nouns is masculine?",
+        "questionDescription": "Identify the masculine noun.",
+        "options": ["sol (sun)", "flor (flower)", "nação (nation)", "noite (night)"],
+        "correct_answers": ["sol (sun)"],
+        "hint": "Most Portuguese nouns ending in consonants are masculine."
+    },
+    {
+        "type": QuestionTypes.MULTIPLE_CHOICE,
+        "questionText": "What is the correct article to use with the Portuguese noun 'mesa'?",
+        "questionDescription": "Choose the appropriate definite article.",
+        "options": ["a", "o", "as", "os"],
+        "correct_answers": ["a"],
+        "hint": "Feminine singular nouns use 'a' as their definite article."
+    },
+    {
+        "type": QuestionTypes.MULTIPLE_CHOICE,
+        "questionText": "Which word is NOT a Portuguese noun?",
+        "questionDescription": "Identify the word that is not a noun in Portuguese.",
+        "options": ["correr (to run)", "pessoa (person)", "cidade (city)", "dia (day)"],
+        "correct_answers": ["correr (to run)"],
+        "hint": "Look for the verb in the list."
+    },
+    {
+        "type": QuestionTypes.MULTIPLE_CHOICE,
+        "questionText": "What is the diminutive form of the Portuguese noun 'casa'?",
+        "questionDescription": "Select the correct diminutive form.",
+        "options": ["casinha", "casita", "casica", "casona"],
+        "correct_answers": ["casinha"],
+        "hint": "Many Portuguese diminutives are formed with the suffix '-inho/a'."
+    }
+]
+
+# Number of pre-shuffled option orderings kept per question
+OPTION_VARIANTS_PER_QUESTION = 8
+
+# Shuffle the options once at import and rotate through the orderings per request
+_OPTION_VARIANTS = [
+    [random.sample(q["options"], k=len(q["options"])) for _ in range(OPTION_VARIANTS_PER_QUESTION)]
+    for q in PREDEFINED_QUESTIONS
+]
+_variant_counter = itertools.count()
+
 # Create router
 router = APIRouter()
 
@@ -44,89 +115,18 @@ async def get_mcqs(payload: McqsRequest = Body(...)):
     num_questions = payload.num_questions
     difficulty = DifficultyLevel(payload.difficulty) if payload.difficulty else DifficultyLevel.MEDIUM
     
-    # Define predefined questions about Portuguese nouns (always have at least 7 questions)
-    predefined_questions = [
-        {
-            "id": str(uuid.uuid4()),
-            "type": QuestionTypes.MULTIPLE_CHOICE,
-            "questionText": "Which Portuguese noun is feminine?",
-            "questionDescription": "Select the noun that is feminine in Portuguese.",
-            "options": ["casa (house)", "livro (book)", "carro (car)", "telefone (telephone)"],
-            "correct_answers": ["casa (house)"],
-            "difficulty": difficulty,
-            "hint": "Nouns ending in 'a' are typically feminine in Portuguese."
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "type": QuestionTypes.MULTIPLE_CHOICE,
-            "questionText": "What is the correct article to use with the Portuguese noun 'livro'?",
-            "questionDescription": "Choose the appropriate definite article.",
-            "options": ["o", "a", "os", "as"],
-            "correct_answers": ["o"],
-            "difficulty": difficulty,
-            "hint": "Masculine singular nouns use 'o' as their definite article."
-        },
+    # Pick the next option ordering and build only the requested number of questions
+    variant = next(_variant_counter) % OPTION_VARIANTS_PER_QUESTION
+    questions = [
         {
-            "id": str(uuid.uuid4()),
-            "type": QuestionTypes.MULTIPLE_CHOICE,
-            "questionText": "What is the plural form of the Portuguese noun 'mulher'?",
-            "questionDescription": "Select the correct plural form.",
-            "options": ["mulheres", "mulhers", "mulheris", "mulher"],
-            "correct_answers": ["mulheres"],
-            "difficulty": difficulty,
-            "hint": "Many Portuguese nouns add 'es' to form the plural."
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "type": QuestionTypes.MULTIPLE_CHOICE,
-            "questionText": "Which of these Portuguese nouns is masculine?",
-            "questionDescription": "Identify the masculine noun.",
-            "options": ["sol (sun)", "flor (flower)", "nação (nation)", "noite (night)"],
-            "correct_answers": ["sol (sun)"],
-            "difficulty": difficulty,
-            "hint": "Most Portuguese nouns ending in consonants are masculine."
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "type": QuestionTypes.MULTIPLE_CHOICE,
-            "questionText": "What is the correct article to use with the Portuguese noun 'mesa'?",
-            "questionDescription": "Choose the appropriate definite article.",
-            "options": ["a", "o", "as", "os"],
-            "correct_answers": ["a"],
-            "difficulty": difficulty,
-            "hint": "Feminine singular nouns use 'a' as their definite article."
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "type": QuestionTypes.MULTIPLE_CHOICE,
-            "questionText": "Which word is NOT a Portuguese noun?",
-            "questionDescription": "Identify the word that is not a noun in Portuguese.",
-            "options": ["correr (to run)", "pessoa (person)", "cidade (city)", "dia (day)"],
-            "correct_answers": ["correr (to run)"],
-            "difficulty": difficulty,
-            "hint": "Look for the verb in the list."
-        },
-        {
-            "id": str(uuid.uuid4()),
-            "type": QuestionTypes.MULTIPLE_CHOICE,
-            "questionText": "What is the diminutive form of the Portuguese noun 'casa'?",
-            "questionDescription": "Select the correct diminutive form.",
-            "options": ["casinha", "casita", "casica", "casona"],
-            "correct_answers": ["casinha"],
-            "difficulty": difficulty,
-            "hint": "Many Portuguese diminutives are formed with the suffix '-inho/a'."
+            "id": uuid.uuid4().hex,
+            **question,
+            "options": _OPTION_VARIANTS[i][variant],
+            "difficulty": difficulty
         }
+        for i, question in enumerate(PREDEFINED_QUESTIONS[:num_questions])
     ]
     
-    # Randomize the options for each question
-    for question in predefined_questions:
-        options = question["options"].copy()
-        random.shuffle(options)
-        question["options"] = options
-    
-    # Limit to the requested number of questions
-    questions = predefined_questions[:num_questions]
-    
     # Create the response
     response = {
         "type": "question",
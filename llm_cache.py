@@ -0,0 +1,94 @@
+"""
+Response cache for short, repetitive OpenAI calls.
+Intent classification, topic extraction and off-topic redirects see the same
+handful of user messages over and over, so their completions are kept in memory.
+"""
+import hashlib
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from cache import SingleFlight, TTLCache
+from dependencies import create_openai_completion, iter_openai_completion, openai_error_text
+
+logger = logging.getLogger(__name__)
+
+# Completion text keyed by a hash of the call kind, context and user message
+_completion_cache = TTLCache(maxsize=4096, ttl=3600)
+# Concurrent misses for the same key share one OpenAI call
+_inflight = SingleFlight()
+
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse whitespace so trivial variations share a cache entry"""
+    return " ".join(text.lower().split())
+
+
+def make_key(kind: str, *parts: str) -> str:
+    """Build a cache key from the call kind and its normalized inputs"""
+    raw = "|".join([kind, *(normalize(part or "") for part in parts)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def _complete_and_cache(key: str, messages: List[Dict[str, Any]], ttl: float, cache: bool, **kwargs) -> str:
+    """Call OpenAI and cache the completion text"""
+    response = await create_openai_completion(messages=messages, **kwargs)
+    content = response.choices[0].message.content
+
+    # Never cache the fallback text returned when the API call failed
+    if cache and not getattr(response, "error", None):
+        _completion_cache.set(key, content, ttl)
+
+    return content
+
+
+async def cached_completion(key: str, messages: List[Dict[str, Any]], ttl: float = 3600, cache: bool = True, **kwargs) -> str:
+    """Return the completion text for messages, calling OpenAI only on a cache miss.
+
+    With cache=False the result is neither read from nor stored in the cache, for inputs
+    unlikely to repeat.
+    """
+    if cache:
+        cached = _completion_cache.get(key)
+        if cached is not None:
+            return cached
+
+    return await _inflight.do(key, _complete_and_cache, key, messages, ttl, cache, **kwargs)
+
+
+async def cached_stream(
+    key: str,
+    messages: List[Dict[str, Any]],
+    ttl: float = 3600,
+    cache: bool = True,
+    on_complete: Optional[Callable[[str], None]] = None,
+    **kwargs
+) -> AsyncIterator[str]:
+    """Stream the completion text for messages, replaying a cached completion as a single piece.
+
+    on_complete is called with the full text only when the stream finishes cleanly; a stream that
+    fails partway, ending in the fallback text, or that is closed early never calls it.
+    """
+    if cache:
+        cached = _completion_cache.get(key)
+        if cached is not None:
+            yield cached
+            if on_complete:
+                on_complete(cached)
+            return
+
+    parts = []
+    try:
+        async for content in iter_openai_completion(messages, **kwargs):
+            parts.append(content)
+            yield content
+    except Exception as e:
+        logger.error("OpenAI API streaming error: %s", e)
+        # Finish with the fallback text, which is never cached
+        yield openai_error_text(e)
+        return
+
+    content = "".join(parts)
+    if cache:
+        _completion_cache.set(key, content, ttl)
+    if on_complete:
+        on_complete(content)
@@ -1,9 +1,47 @@
+import asyncio
+import contextvars
 import json
+import logging
 import uuid
 import random
+import requests
 from typing import List, Optional
 from models import QuestionTypes, DifficultyLevel, MultipleChoiceQuestion, FillInTheBlankQuestion, BaseQuestion
 
+logger = logging.getLogger(__name__)
+
+# Custom prompt from CMS, scoped to the current request so concurrent requests don't share it
+_custom_prompt: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("custom_prompt", default=None)
+
+# Upper bound on simultaneous OpenAI calls from async question generation
+MAX_CONCURRENT_GENERATIONS = 16
+
+# System message for generation without a CMS prompt; built once and shared by every request
+_DEFAULT_SYSTEM_MESSAGE = {"role": "system", "content": "You are a Portuguese language expert."}
+
+# OpenAI JSON mode: every generation prompt asks for a JSON object, and this guarantees the reply parses
+_JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+# Angles assigned round-robin to questions in a batch so each one targets something different
+QUESTION_FOCUS_ANGLES = [
+    "meaning and translation",
+    "correct usage in a sentence",
+    "grammatical form",
+    "a common learner mistake",
+    "an exception or irregular case"
+]
+
+def diversify_topic(topic: str, index: int) -> str:
+    """Give the index-th question in a batch its own focus within the topic"""
+    return f"{topic} (focus: {QUESTION_FOCUS_ANGLES[index % len(QUESTION_FOCUS_ANGLES)]})"
+
+def _avoid_instructions(avoid: Optional[List[str]]) -> str:
+    """Prompt suffix listing existing questions the new one must differ from"""
+    if not avoid:
+        return ""
+    existing = "\n".join(f"- {text}" for text in avoid)
+    return f"\n\nThe new question MUST be different from these existing questions:\n{existing}\n"
+
 class QuestionGenerator:
     """
     Class to generate Portuguese language learning questions using OpenAI
@@ -13,7 +51,12 @@ class QuestionGenerator:
         """Initialize the question generator with OpenAI API key"""
         self.openai_api_key = openai_api_key
         self.question_templates = self._load_question_templates()
-        self.custom_prompt = None  # Store custom prompt from CMS
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+    
+    @property
+    def custom_prompt(self) -> Optional[str]:
+        """Custom prompt from CMS for the current request, if any"""
+        return _custom_prompt.get()
     
     def _load_question_templates(self):
         """Load question templates for different difficulty levels"""
@@ -67,35 +110,35 @@ class QuestionGenerator:
     
     def configure_custom_prompt(self, prompt: Optional[str] = None):
         """Configure a custom prompt for question generation"""
-        self.custom_prompt = prompt
+        _custom_prompt.set(prompt)
         if prompt is not None:
-            print(f"Custom prompt set: {prompt[:50]}...")
+            logger.debug("Custom prompt set: %.50s...", prompt)
         else:
-            print("Custom prompt reset to default")
+            logger.debug("Custom prompt reset to default")
     
-    def _get_openai_completion(self, prompt: str) -> str:
+    def _get_openai_completion(self, prompt: str, response_format: Optional[dict] = None) -> str:
         """Get completion from OpenAI without using async"""
         try:
             # For simplicity, we'll use direct API calls
-            import requests
-            import json
-            
             headers = {
                 "Content-Type": "application/json",
                 "Authorization": f"Bearer {self.openai_api_key}"
             }
             
             # Use custom prompt if available
-            system_content = self.custom_prompt if self.custom_prompt else "You are a Portuguese language expert."
+            custom_prompt = self.custom_prompt
+            system_message = {"role": "system", "content": custom_prompt} if custom_prompt else _DEFAULT_SYSTEM_MESSAGE
             
             data = {
                 "model": "gpt-3.5-turbo",
                 "messages": [
-                    {"role": "system", "content": system_content},
+                    system_message,
                     {"role": "user", "content": prompt}
                 ],
                 "temperature": 0.7
             }
+            if response_format is not None:
+                data["response_format"] = response_format
             
             response = requests.post(
                 "https://api.openai.com/v1/chat/completions",
@@ -108,17 +151,18 @@ class QuestionGenerator:
             if "choices" in result and len(result["choices"]) > 0:
                 return result["choices"][0]["message"]["content"]
             else:
-                print(f"Unexpected OpenAI response: {result}")
+                logger.error("Unexpected OpenAI response: %s", result)
                 return "Error generating content"
                 
         except Exception as e:
-            print(f"Error in OpenAI completion: {str(e)}")
+            logger.error("Error in OpenAI completion: %s", e)
             return "Error: " + str(e)
     
     def generate_multiple_choice_question(
         self, 
         difficulty: DifficultyLevel, 
-        topic: str = "basic vocabulary"
+        topic: str = "basic vocabulary",
+        avoid: Optional[List[str]] = None
     ) -> MultipleChoiceQuestion:
         """Generate a multiple choice question about Portuguese"""
         # Generate the question using a more varied approach with OpenAI
@@ -153,10 +197,10 @@ class QuestionGenerator:
             "correct_answers": ["a casa (feminine)"],
             "hint": "Most words ending in 'a' in Portuguese are feminine."
         }}
-        """
+        """ + _avoid_instructions(avoid)
         
         # First attempt
-        response_text = self._get_openai_completion(prompt)
+        response_text = self._get_openai_completion(prompt, response_format=_JSON_RESPONSE_FORMAT)
         
         try:
             response_json = json.loads(response_text)
@@ -170,7 +214,7 @@ class QuestionGenerator:
             
             # Create a multiple choice question
             question = MultipleChoiceQuestion(
-                id=str(uuid.uuid4()),
+                id=uuid.uuid4().hex,
                 type=QuestionTypes.MULTIPLE_CHOICE,
                 questionText=response_json["questionText"],
                 questionDescription=response_json["questionDescription"],
@@ -182,8 +226,8 @@ class QuestionGenerator:
             
             return question
         except Exception as e:
-            print(f"Error parsing JSON from OpenAI: {str(e)}")
-            print(f"Response was: {response_text}")
+            logger.warning("Error parsing JSON from OpenAI: %s", e)
+            logger.debug("Response was: %s", response_text)
             
             # Second attempt with a simplified prompt
             try:
@@ -201,14 +245,14 @@ class QuestionGenerator:
                 
                 Response must be valid JSON."""
                 
-                retry_response = self._get_openai_completion(retry_prompt)
+                retry_response = self._get_openai_completion(retry_prompt, response_format=_JSON_RESPONSE_FORMAT)
                 retry_json = json.loads(retry_response)
                 
                 options = retry_json["options"].copy()
                 random.shuffle(options)
                 
                 return MultipleChoiceQuestion(
-                    id=str(uuid.uuid4()),
+                    id=uuid.uuid4().hex,
                     type=QuestionTypes.MULTIPLE_CHOICE,
                     questionText=retry_json["questionText"],
                     questionDescription=retry_json["questionDescription"],
@@ -218,7 +262,7 @@ class QuestionGenerator:
                     hint=retry_json["hint"]
                 )
             except Exception as retry_error:
-                print(f"Second attempt also failed: {str(retry_error)}")
+                logger.warning("Second attempt also failed: %s", retry_error)
                 
                 # Third attempt with explicit structure
                 final_prompt = f"""Create a basic Portuguese multiple choice question.
@@ -235,14 +279,14 @@ class QuestionGenerator:
                 grammar structures, or language examples in Portuguese."""
                 
                 try:
-                    final_response = self._get_openai_completion(final_prompt)
+                    final_response = self._get_openai_completion(final_prompt, response_format=_JSON_RESPONSE_FORMAT)
                     final_json = json.loads(final_response)
                     
                     options = final_json["options"].copy()
                     random.shuffle(options)
                     
                     return MultipleChoiceQuestion(
-                        id=str(uuid.uuid4()),
+                        id=uuid.uuid4().hex,
                         type=QuestionTypes.MULTIPLE_CHOICE,
                         questionText=final_json["questionText"],
                         questionDescription=final_json["questionDescription"],
@@ -252,13 +296,88 @@ class QuestionGenerator:
                         hint=final_json["hint"]
                     )
                 except Exception as final_error:
-                    print(f"All attempts to generate question failed: {str(final_error)}")
+                    logger.error("All attempts to generate question failed: %s", final_error)
                     raise final_error
     
+    def generate_multiple_choice_batch(
+        self,
+        difficulty: DifficultyLevel,
+        topic: str,
+        num_questions: int,
+        avoid: Optional[List[str]] = None
+    ) -> List[MultipleChoiceQuestion]:
+        """Generate several distinct multiple choice questions about Portuguese in a single OpenAI call"""
+        focus_angles = "\n".join(
+            f"{i + 1}. {QUESTION_FOCUS_ANGLES[i % len(QUESTION_FOCUS_ANGLES)]}" for i in range(num_questions)
+        )
+        prompt = f"""Create {num_questions} different Portuguese language multiple choice questions about '{topic}' at {difficulty} difficulty level.
+        
+        Each question must test something different. Give question N this focus:
+        {focus_angles}
+        
+        If the topic is about nouns, create questions about gender (masculine/feminine), pluralization, or noun usage.
+        If the topic is about verbs, focus on conjugation, tense usage, or irregular verbs.
+        If the topic is about vocabulary, focus on translations, synonyms, or contextual usage.
+        If the topic is about grammar, focus on sentence structure, prepositions, or articles.
+        
+        Format your response as a valid JSON object with a "questions" key holding a list of {num_questions} objects with these keys:
+        - questionText: The full text of the question in English
+        - questionDescription: Brief description of what to do in English
+        - options: A list of 4 options (first one should be correct)
+        - correct_answers: A list with just the correct answer as string
+        - hint: A subtle hint to help the user in English
+        
+        IMPORTANT: Write questionText, questionDescription and hint in English, but keep any Portuguese vocabulary, 
+        grammar structures, or language examples in Portuguese.
+        
+        Example format:
+        {{
+            "questions": [
+                {{
+                    "questionText": "What is the correct gender and article for the Portuguese word 'casa'?",
+                    "questionDescription": "Choose the correct gender and article for this noun.",
+                    "options": ["a casa (feminine)", "o casa (masculine)", "as casa (feminine plural)", "os casa (masculine plural)"],
+                    "correct_answers": ["a casa (feminine)"],
+                    "hint": "Most words ending in 'a' in Portuguese are feminine."
+                }}
+            ]
+        }}
+        """ + _avoid_instructions(avoid)
+        
+        response_text = self._get_openai_completion(prompt, response_format=_JSON_RESPONSE_FORMAT)
+        try:
+            items = json.loads(response_text)["questions"]
+            if not isinstance(items, list):
+                raise ValueError(f'"questions" is a {type(items).__name__}, not a list')
+        except Exception as e:
+            logger.warning("Error parsing question batch from OpenAI: %s", e)
+            return []
+        
+        # Keep every well-formed question; a bad item doesn't discard the rest of the batch
+        questions = []
+        for item in items[:num_questions]:
+            try:
+                options = list(item["options"])
+                random.shuffle(options)
+                questions.append(MultipleChoiceQuestion(
+                    id=uuid.uuid4().hex,
+                    type=QuestionTypes.MULTIPLE_CHOICE,
+                    questionText=item["questionText"],
+                    questionDescription=item["questionDescription"],
+                    options=options,
+                    correct_answers=item["correct_answers"],
+                    difficulty=difficulty,
+                    hint=item["hint"]
+                ))
+            except Exception as e:
+                logger.warning("Skipping malformed question in batch: %s", e)
+        return questions
+    
     def generate_fill_in_blank_question(
         self, 
         difficulty: DifficultyLevel,
-        topic: str = "verb conjugation"
+        topic: str = "verb conjugation",
+        avoid: Optional[List[str]] = None
     ) -> FillInTheBlankQuestion:
         """Generate a fill-in-the-blank question about Portuguese"""
         # Use OpenAI to generate a question
@@ -283,17 +402,17 @@ class QuestionGenerator:
             "correct_answers": ["falo"],
             "hint": "The verb is conjugated in the first person singular present tense."
         }}
-        """
+        """ + _avoid_instructions(avoid)
         
         # First attempt
-        response_text = self._get_openai_completion(prompt)
+        response_text = self._get_openai_completion(prompt, response_format=_JSON_RESPONSE_FORMAT)
         
         try:
             response_json = json.loads(response_text)
             
             # Create a fill-in-the-blank question
             question = FillInTheBlankQuestion(
-                id=str(uuid.uuid4()),
+                id=uuid.uuid4().hex,
                 type=QuestionTypes.FILL_IN_THE_BLANKS,
                 questionText=response_json["questionText"],
                 questionDescription=response_json["questionDescription"],
@@ -307,8 +426,8 @@ class QuestionGenerator:
             
             return question
         except Exception as e:
-            print(f"Error parsing JSON from OpenAI: {str(e)}")
-            print(f"Response was: {response_text}")
+            logger.warning("Error parsing JSON from OpenAI: %s", e)
+            logger.debug("Response was: %s", response_text)
             
             # Second attempt with a simplified prompt
             try:
@@ -323,11 +442,11 @@ class QuestionGenerator:
                 
                 Response must be valid JSON."""
                 
-                retry_response = self._get_openai_completion(retry_prompt)
+                retry_response = self._get_openai_completion(retry_prompt, response_format=_JSON_RESPONSE_FORMAT)
                 retry_json = json.loads(retry_response)
                 
                 return FillInTheBlankQuestion(
-                    id=str(uuid.uuid4()),
+                    id=uuid.uuid4().hex,
                     type=QuestionTypes.FILL_IN_THE_BLANKS,
                     questionText=retry_json["questionText"],
                     questionDescription=retry_json["questionDescription"],
@@ -339,7 +458,7 @@ class QuestionGenerator:
                     numberOfBlanks=1
                 )
             except Exception as retry_error:
-                print(f"Second attempt also failed: {str(retry_error)}")
+                logger.warning("Second attempt also failed: %s", retry_error)
                 
                 # Third attempt with explicit structure
                 final_prompt = f"""Create a basic Portuguese fill-in-the-blank question.
@@ -355,11 +474,11 @@ class QuestionGenerator:
                 Write questionText, questionDescription and hint in English, but keep the questionSentence in Portuguese."""
                 
                 try:
-                    final_response = self._get_openai_completion(final_prompt)
+                    final_response = self._get_openai_completion(final_prompt, response_format=_JSON_RESPONSE_FORMAT)
                     final_json = json.loads(final_response)
                     
                     return FillInTheBlankQuestion(
-                        id=str(uuid.uuid4()),
+                        id=uuid.uuid4().hex,
                         type=QuestionTypes.FILL_IN_THE_BLANKS,
                         questionText=final_json["questionText"],
                         questionDescription=final_json["questionDescription"],
@@ -371,17 +490,15 @@ class QuestionGenerator:
                         numberOfBlanks=1
                     )
                 except Exception as final_error:
-                    print(f"All attempts to generate question failed: {str(final_error)}")
+                    logger.error("All attempts to generate question failed: %s", final_error)
                     raise final_error
     
-    def generate_questions(
-        self, 
-        num_questions: int = 2,
-        difficulty: Optional[DifficultyLevel] = None,
-        question_types: Optional[List[QuestionTypes]] = None,
-        topic: str = "Portuguese language"
-    ) -> List[BaseQuestion]:
-        """Generate a list of Portuguese language questions"""
+    def _normalize_generation_args(
+        self,
+        difficulty: Optional[DifficultyLevel],
+        question_types: Optional[List[QuestionTypes]]
+    ):
+        """Apply defaults and convert string values to enums"""
         # Set default difficulty if not provided
         if not difficulty:
             difficulty = DifficultyLevel.MEDIUM
@@ -396,109 +513,187 @@ class QuestionGenerator:
             
         if isinstance(question_types, list) and all(isinstance(qt, str) for qt in question_types):
             question_types = [QuestionTypes(qt) for qt in question_types]
+        
+        return difficulty, question_types
+    
+    def generate_questions(
+        self, 
+        num_questions: int = 2,
+        difficulty: Optional[DifficultyLevel] = None,
+        question_types: Optional[List[QuestionTypes]] = None,
+        topic: str = "Portuguese language"
+    ) -> List[BaseQuestion]:
+        """Generate a list of Portuguese language questions"""
+        difficulty, question_types = self._normalize_generation_args(difficulty, question_types)
             
+        # Randomly select all question types up front in a single call
+        picked_types = random.choices(question_types, k=num_questions)
+        
         # Generate questions
         questions = []
-        for i in range(num_questions):
+        for i, question_type in enumerate(picked_types):
             try:
-                # Randomly select question type from the provided types
-                question_type = random.choice(question_types)
-                
                 # Make the topic slightly different for each question to encourage uniqueness
-                variation_topic = f"{topic} (variation {i+1})"
+                variation_topic = diversify_topic(topic, i)
                 
-                if question_type == QuestionTypes.MULTIPLE_CHOICE:
-                    question = self.generate_multiple_choice_question(
-                        difficulty=difficulty, 
-                        topic=variation_topic
-                    )
-                    if question:  # Only add if it's not None
-                        questions.append(question)
-                elif question_type == QuestionTypes.FILL_IN_THE_BLANKS:
-                    question = self.generate_fill_in_blank_question(
-                        difficulty=difficulty, 
-                        topic=variation_topic
-                    )
-                    if question:  # Only add if it's not None
-                        questions.append(question)
+                question = self.generate_question(question_type, difficulty, variation_topic)
+                if question:  # Only add if it's not None
+                    questions.append(question)
             except Exception as e:
-                print(f"Error generating question {i+1}: {str(e)}")
+                logger.error("Error generating question %d: %s", i + 1, e)
                 continue  # Skip this question and try the next one
                 
         # If no questions were generated, try one more time with a more generic topic
         if not questions:
-            print("Failed to generate any questions. Trying one more time with simplified approach.")
-            
-            try:
-                # Try with a more simplified approach for at least one question
-                generic_topic = "basic Portuguese"
-                question_type = question_types[0]  # Use the first specified type
+            logger.warning("Failed to generate any questions. Trying one more time with simplified approach.")
+            question = self._generate_simplified_question(difficulty, question_types[0])
+            if question:
+                questions.append(question)
                 
-                if question_type == QuestionTypes.MULTIPLE_CHOICE:
-                    # Use the most simplified prompt
-                    simplified_prompt = f"""Create a basic Portuguese multiple choice question.
-                    Format the response EXACTLY as:
-                    {{
-                        "questionText": "What is X in Portuguese?",
-                        "questionDescription": "Choose the correct option.",
-                        "options": ["option1", "option2", "option3", "option4"],
-                        "correct_answers": ["option1"],
-                        "hint": "A hint about Portuguese."
-                    }}
-                    
-                    IMPORTANT: Write questionText, questionDescription and hint in English, but keep any Portuguese vocabulary, 
-                    grammar structures, or language examples in Portuguese."""
-                    
-                    response = self._get_openai_completion(simplified_prompt)
-                    response_json = json.loads(response)
-                    
-                    options = response_json["options"].copy()
-                    random.shuffle(options)
-                    
-                    question = MultipleChoiceQuestion(
-                        id=str(uuid.uuid4()),
-                        type=QuestionTypes.MULTIPLE_CHOICE,
-                        questionText=response_json["questionText"],
-                        questionDescription=response_json["questionDescription"],
-                        options=options,
-                        correct_answers=response_json["correct_answers"],
-                        difficulty=difficulty,
-                        hint=response_json["hint"]
-                    )
-                    questions.append(question)
-                else:
-                    # Simplified fill-in-the-blank
-                    simplified_prompt = f"""Create a simple Portuguese fill-in-the-blank question.
-                    Format the response EXACTLY as:
-                    {{
-                        "questionText": "Fill in the blank:",
-                        "questionDescription": "Complete the Portuguese sentence.",
-                        "questionSentence": "A simple Portuguese sentence with ____ for the blank.",
-                        "correct_answers": ["answer"],
-                        "hint": "A simple hint."
-                    }}
-                    
-                    Write questionText, questionDescription and hint in English, but keep the questionSentence in Portuguese."""
-                    
-                    response = self._get_openai_completion(simplified_prompt)
-                    response_json = json.loads(response)
-                    
-                    question = FillInTheBlankQuestion(
-                        id=str(uuid.uuid4()),
-                        type=QuestionTypes.FILL_IN_THE_BLANKS,
-                        questionText=response_json["questionText"],
-                        questionDescription=response_json["questionDescription"],
-                        questionSentence=response_json["questionSentence"],
-                        correct_answers=response_json["correct_answers"],
-                        difficulty=difficulty,
-                        hint=response_json["hint"],
-                        blankSeparator="____",
-                        numberOfBlanks=1
-                    )
-                    questions.append(question)
-            except Exception as final_e:
-                print(f"Final attempt to generate question also failed: {str(final_e)}")
-                # At this point we've tried everything and failed.
-                # We'll return an empty list and let the caller handle it.
+        return questions
+    
+    def generate_question(
+        self,
+        question_type: QuestionTypes,
+        difficulty: DifficultyLevel,
+        topic: str,
+        avoid: Optional[List[str]] = None
+    ) -> BaseQuestion:
+        """Generate a single question of the given type"""
+        if question_type == QuestionTypes.MULTIPLE_CHOICE:
+            return self.generate_multiple_choice_question(difficulty=difficulty, topic=topic, avoid=avoid)
+        return self.generate_fill_in_blank_question(difficulty=difficulty, topic=topic, avoid=avoid)
+    
+    async def agenerate_question(
+        self,
+        question_type: QuestionTypes,
+        difficulty: DifficultyLevel,
+        topic: str,
+        avoid: Optional[List[str]] = None
+    ) -> BaseQuestion:
+        """Generate a single question in a worker thread, bounded by the concurrency limit"""
+        async with self._semaphore:
+            return await asyncio.to_thread(self.generate_question, question_type, difficulty, topic, avoid)
+    
+    async def agenerate_questions(
+        self, 
+        num_questions: int = 2,
+        difficulty: Optional[DifficultyLevel] = None,
+        question_types: Optional[List[QuestionTypes]] = None,
+        topic: str = "Portuguese language"
+    ) -> List[BaseQuestion]:
+        """Generate a list of Portuguese language questions concurrently"""
+        difficulty, question_types = self._normalize_generation_args(difficulty, question_types)
+        
+        # Multiple choice questions can all come from one OpenAI call
+        if question_types == [QuestionTypes.MULTIPLE_CHOICE]:
+            async with self._semaphore:
+                questions = await asyncio.to_thread(
+                    self.generate_multiple_choice_batch, difficulty, topic, num_questions
+                )
+            if questions:
+                return questions
+            logger.warning("Multiple choice batch failed. Generating questions individually.")
+        
+        picked_types = random.choices(question_types, k=num_questions)
+        
+        # Each question is an independent OpenAI call, so issue them all at once
+        results = await asyncio.gather(
+            *[
+                self.agenerate_question(question_type, difficulty, diversify_topic(topic, i))
+                for i, question_type in enumerate(picked_types)
+            ],
+            return_exceptions=True
+        )
+        
+        questions = []
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.error("Error generating question %d: %s", i + 1, result)
+            elif result:  # Only add if it's not None
+                questions.append(result)
+        
+        # If no questions were generated, try one more time with a more generic topic
+        if not questions:
+            logger.warning("Failed to generate any questions. Trying one more time with simplified approach.")
+            async with self._semaphore:
+                question = await asyncio.to_thread(
+                    self._generate_simplified_question, difficulty, question_types[0]
+                )
+            if question:
+                questions.append(question)
+        
+        return questions
+    
+    def _generate_simplified_question(
+        self,
+        difficulty: DifficultyLevel,
+        question_type: QuestionTypes
+    ) -> Optional[BaseQuestion]:
+        """Last-resort generation of a single basic question, or None if it fails"""
+        try:
+            if question_type == QuestionTypes.MULTIPLE_CHOICE:
+                # Use the most simplified prompt
+                simplified_prompt = f"""Create a basic Portuguese multiple choice question.
+                Format the response EXACTLY as this JSON object:
+                {{
+                    "questionText": "What is X in Portuguese?",
+                    "questionDescription": "Choose the correct option.",
+                    "options": ["option1", "option2", "option3", "option4"],
+                    "correct_answers": ["option1"],
+                    "hint": "A hint about Portuguese."
+                }}
+                
+                IMPORTANT: Write questionText, questionDescription and hint in English, but keep any Portuguese vocabulary, 
+                grammar structures, or language examples in Portuguese."""
+                
+                response = self._get_openai_completion(simplified_prompt, response_format=_JSON_RESPONSE_FORMAT)
+                response_json = json.loads(response)
+                
+                options = response_json["options"].copy()
+                random.shuffle(options)
+                
+                return MultipleChoiceQuestion(
+                    id=uuid.uuid4().hex,
+                    type=QuestionTypes.MULTIPLE_CHOICE,
+                    questionText=response_json["questionText"],
+                    questionDescription=response_json["questionDescription"],
+                    options=options,
+                    correct_answers=response_json["correct_answers"],
+                    difficulty=difficulty,
+                    hint=response_json["hint"]
+                )
+            else:
+                # Simplified fill-in-the-blank
+                simplified_prompt = f"""Create a simple Portuguese fill-in-the-blank question.
+                Format the response EXACTLY as this JSON object:
+                {{
+                    "questionText": "Fill in the blank:",
+                    "questionDescription": "Complete the Portuguese sentence.",
+                    "questionSentence": "A simple Portuguese sentence with ____ for the blank.",
+                    "correct_answers": ["answer"],
+                    "hint": "A simple hint."
+                }}
                 
-        return questions 
\ No newline at end of file
+                Write questionText, questionDescription and hint in English, but keep the questionSentence in Portuguese."""
+                
+                response = self._get_openai_completion(simplified_prompt, response_format=_JSON_RESPONSE_FORMAT)
+                response_json = json.loads(response)
+                
+                return FillInTheBlankQuestion(
+                    id=uuid.uuid4().hex,
+                    type=QuestionTypes.FILL_IN_THE_BLANKS,
+                    questionText=response_json["questionText"],
+                    questionDescription=response_json["questionDescription"],
+                    questionSentence=response_json["questionSentence"],
+                    correct_answers=response_json["correct_answers"],
+                    difficulty=difficulty,
+                    hint=response_json["hint"],
+                    blankSeparator="____",
+                    numberOfBlanks=1
+                )
+        except Exception as final_e:
+            logger.error("Final attempt to generate question also failed: %s", final_e)
+            # At this point we've tried everything and failed.
+            # We'll return None and let the caller handle it.
+            return None
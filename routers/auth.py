@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional
+import logging
 import os
 import uuid
 from datetime import datetime, timedelta
@@ -10,6 +11,9 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 # Import necessary models
 from models import AppUser
+from database import db
+
+logger = logging.getLogger(__name__)
 
 # Initialize router
 router = APIRouter(
@@ -54,6 +58,16 @@ class Token(BaseModel):
     first_name: str
     last_name: str
 
+# Only the fields needed to verify a login and build the token response
+LOGIN_PROJECTION = {
+    "_id": 1,
+    "email": 1,
+    "username": 1,
+    "first_name": 1,
+    "last_name": 1,
+    "hashed_password": 1
+}
+
 # Function to create access token
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -66,16 +80,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 @router.post("/signup", response_model=UserSignupResponse)
 async def signup(user_data: UserSignup):
     """Register a new user"""
-    # Get database connection
-    from database import db
-    
     # Check if email already exists
-    existing_user = db.app_users.find_one({"email": user_data.email})
+    existing_user = db.app_users.find_one({"email": user_data.email}, {"_id": 1})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Check if username already exists
-    existing_username = db.app_users.find_one({"username": user_data.username})
+    existing_username = db.app_users.find_one({"username": user_data.username}, {"_id": 1})
     if existing_username:
         raise HTTPException(status_code=400, detail="Username already taken")
 
@@ -84,9 +95,10 @@ async def signup(user_data: UserSignup):
         hashed_password = pwd_context.hash(user_data.password)
         
         # Generate a user ID
-        user_id = str(uuid.uuid4())
+        user_id = uuid.uuid4().hex
         
         # Create user object
+        now = datetime.utcnow()
         new_user = AppUser(
             _id=user_id,
             email=user_data.email,
@@ -95,12 +107,12 @@ async def signup(user_data: UserSignup):
             last_name=user_data.last_name or "",
             hashed_password=hashed_password,
             is_active=True,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            created_at=now,
+            updated_at=now
         )
         
         # Save user to database using the AppUser model
-        user_dict = new_user.dict()
+        user_dict = new_user.model_dump()
         result = db.app_users.insert_one(user_dict)
         
         # Return success response with the user ID
@@ -120,11 +132,8 @@ async def signup(user_data: UserSignup):
 async def login(user_data: UserLogin):
     """Authenticate a user and return a JWT token"""
     try:
-        # Get database connection
-        from database import db
-        
         # Find user by email in app_users collection
-        user = db.app_users.find_one({"email": user_data.email})
+        user = db.app_users.find_one({"email": user_data.email}, LOGIN_PROJECTION)
         if not user:
             raise HTTPException(status_code=401, detail="Invalid email or password")
         
@@ -153,8 +162,7 @@ async def login(user_data: UserLogin):
         )
         
     except Exception as e:
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Login error")
         raise HTTPException(
             status_code=500,
             detail=f"Login error: {str(e)}"
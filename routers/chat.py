@@ -1,6 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import StreamingResponse
 from typing import Dict, Any, List, Optional
+import asyncio
+import html
+import json
+import logging
+import orjson
 import os
+import random
+import re
+import zlib
 from datetime import datetime
 import uuid
 from pydantic import BaseModel
@@ -10,10 +19,17 @@ from models import (
     MessageSenders, ResponseType, QuestionTypes, MultipleChoiceQuestion, FillInTheBlankQuestion,
     ProcessMessage
 )
-from question_generator import QuestionGenerator
-from database import MongoDBConversationManager
-from dependencies import create_openai_completion, get_current_user, fetch_prompt_from_cms
+from question_generator import QuestionGenerator, diversify_topic
+from database import MongoDBConversationManager, db
+from dependencies import (
+    OPENAI_ERROR_PREFIX, create_openai_completion, stream_openai_completion, get_current_user, fetch_prompt_from_cms
+)
+from llm_cache import cached_completion, cached_stream, make_key, normalize
+from cache import SingleFlight, TTLCache
 from routers.prompts import ChatPrompts  # Import the centralized prompts
+from routers import intent_router, topic_extractor
+
+logger = logging.getLogger(__name__)
 
 # Initialize router
 router = APIRouter(
@@ -26,36 +42,134 @@ router = APIRouter(
 openai_api_key = os.getenv("OPENAI_API_KEY")
 question_generator = QuestionGenerator(openai_api_key)
 
+# Intent classification and topic extraction only need a few tokens, so a smaller, faster model is enough
+FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+
+# Phrases that show the AI's last message asked the user something
+_QUESTION_RE = re.compile(r"\?|\b(?:can|do|could|would|have)\s+you\b|\bhow\s+about\b", re.I)
+
+def _asks_question(ai_message):
+    """Whether an AI message asks the user something; stored with the message as was_question"""
+    return bool(_QUESTION_RE.search(ai_message))
+
+# Punctuation is ignored when comparing generated questions for duplicates
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
+def _question_text(question):
+    """The text that identifies a question: questionText for MCQs, questionSentence for gap fills"""
+    if question.type == QuestionTypes.MULTIPLE_CHOICE:
+        return question.questionText
+    return question.questionSentence
+
+def _text_key(text):
+    """Normalised question text, so copies differing only in case, punctuation or spacing match"""
+    return " ".join(_PUNCTUATION_RE.sub(" ", (text or "").lower()).split())
+
+def _question_key(question):
+    return _text_key(_question_text(question))
+
+def _add_unique(questions, unique_questions, seen):
+    """Append each question whose normalised text isn't in seen yet, skipping missing ones"""
+    for question in questions:
+        if question is None:
+            continue
+        key = _question_key(question)
+        if key not in seen:
+            seen.add(key)
+            unique_questions.append(question)
+    return unique_questions
+
+# Number of most recent messages sent to OpenAI as general chat context; messages that drop out
+# of it are folded into a rolling summary straight away, so none are missing from the context
+HISTORY_WINDOW = 20
+
+# Longer messages rarely repeat, so their completions would only crowd short, common ones out of the cache
+_CACHEABLE_MESSAGE_CHARS = 80
+
+def _is_cacheable(user_message):
+    """Whether completions for this message are worth caching"""
+    return len(user_message) <= _CACHEABLE_MESSAGE_CHARS
+
+# Static few-shot examples, built once rather than on every request
+_INTENT_EXAMPLES = ChatPrompts.intent_classification_examples()
+_TOPIC_EXAMPLES = ChatPrompts.topic_extraction_examples()
+_CLASSIFICATION_EXAMPLES = ChatPrompts.combined_classification_examples()
+
+# PyMongo is synchronous, so run its calls in a worker thread to keep the event loop free
+async def _add_messages(conversation_id, messages):
+    """Add the request's messages to the conversation in one write without blocking the event loop"""
+    return await asyncio.to_thread(MongoDBConversationManager.add_messages, conversation_id, messages)
+
+async def _get_conversation_history(conversation_id, limit=50):
+    """Get the conversation history without blocking the event loop"""
+    return await asyncio.to_thread(MongoDBConversationManager.get_conversation_history, conversation_id, limit)
+
+# References to fire-and-forget writes, so they aren't garbage collected before finishing
+_background_writes = set()
+
+async def _add_messages_task(conversation_id, messages):
+    try:
+        await _add_messages(conversation_id=conversation_id, messages=messages)
+    except Exception:
+        logger.exception("Error storing messages for conversation %s", conversation_id)
+
+def _add_messages_in_background(conversation_id, messages):
+    """Store messages without making the caller wait for the write"""
+    task = asyncio.create_task(_add_messages_task(conversation_id, messages))
+    _background_writes.add(task)
+    task.add_done_callback(_background_writes.discard)
+
+async def _get_rolling_summary(conversation_id):
+    """Get the stored summary of older messages without blocking the event loop"""
+    return await asyncio.to_thread(MongoDBConversationManager.get_rolling_summary, conversation_id)
+
 async def extract_user_settings(user):
     """Get user settings from database"""
-    from database import db
     user_id = str(user["_id"])
-    user_settings = db.user_settings.find_one({"user_id": user_id})
+    user_settings = await asyncio.to_thread(db.user_settings.find_one, {"user_id": user_id})
     preferred_language = user_settings.get("preferred_language", "Portuguese") if user_settings else "Portuguese"
-    print(f"preferred_language: {preferred_language}")
+    logger.debug("preferred_language: %s", preferred_language)
     return preferred_language
 
+# Topic content changes rarely, so CMS responses are reused for a few minutes
+CMS_CACHE_TTL = float(os.getenv("CMS_CACHE_TTL", "600"))
+_cms_cache = TTLCache(maxsize=1024, ttl=CMS_CACHE_TTL)
+# Concurrent misses for the same topics share one CMS request
+_cms_inflight = SingleFlight()
+
+async def get_or_fetch_cms(topic_ids):
+    """Return the CMS data for the topics, fetching it at most once at a time per key"""
+    cms_data = _cms_cache.get(topic_ids)
+    if cms_data is not None:
+        return cms_data
+    
+    cms_data = await _cms_inflight.do(topic_ids, fetch_prompt_from_cms, topic_ids)
+    # Failed lookups come back with success=False and should be retried on the next message
+    if cms_data.get('success'):
+        _cms_cache.set(topic_ids, cms_data)
+    return cms_data
+
 async def fetch_topic_prompt(topic_ids):
     """Fetch prompt and topic name from CMS"""
     topic_name = "Portuguese language"  # Default topic name
     
     try:
-        cms_data = await fetch_prompt_from_cms(topic_ids)
-        print(f"Received CMS data: {cms_data}")
+        cms_data = await get_or_fetch_cms(topic_ids)
+        logger.debug("Received CMS data: %s", cms_data)
         
         # Extract prompt and topic name from CMS response
         if cms_data.get('data'):
             cms_prompt = cms_data.get('data', {}).get('prompt', '')
             topic_name = cms_data.get('data', {}).get('name', 'Portuguese language')
-            print(f"Extracted topic name from CMS: '{topic_name}'")
+            logger.debug("Extracted topic name from CMS: '%s'", topic_name)
         else:
             cms_prompt = cms_data.get('prompt', '')
             
         if not cms_prompt:
-            print("Warning: No prompt received from CMS, using default system prompt")
+            logger.warning("No prompt received from CMS, using default system prompt")
             cms_prompt = ChatPrompts.default_system_prompt()
     except Exception as e:
-        print(f"Error getting prompt from CMS: {str(e)}")
+        logger.error("Error getting prompt from CMS: %s", e)
         # Fallback to default prompt if CMS call fails
         cms_prompt = ChatPrompts.default_system_prompt()
     
@@ -63,97 +177,174 @@ async def fetch_topic_prompt(topic_ids):
 
 async def detect_intent(user_message, topic_name):
     """Detect user intent from message content"""
-    # Prepare prompt for intent detection
+    # Skip the OpenAI round-trip when the keyword rules already decide the intent
+    local_intent = intent_router.classify(user_message)
+    if local_intent:
+        logger.debug("Local intent detection: '%s' for message: '%s'", local_intent, user_message)
+        return local_intent
+    
+    # Static system prompt and examples first, then the learning topic and the current user message
     intent_prompt = [
-        {"role": "system", "content": ChatPrompts.intent_classification_prompt(topic_name)}
+        {"role": "system", "content": ChatPrompts.intent_classification_prompt()},
+        *_INTENT_EXAMPLES,
+        ChatPrompts.learning_topic_message(topic_name),
+        {"role": "user", "content": user_message}
     ]
     
-    # Add intent classification examples
-    intent_prompt.extend(ChatPrompts.intent_classification_examples())
+    # Get intent classification from OpenAI (repeated messages are served from cache)
+    intent_content = await cached_completion(
+        make_key("intent", topic_name, user_message),
+        intent_prompt,
+        cache=_is_cacheable(user_message),
+        model=FAST_MODEL,
+        max_tokens=16,
+        temperature=0
+    )
+    intent_text = intent_content.strip().lower()
+    logger.debug("Intent detection: '%s' for message: '%s'", intent_text, user_message)
     
-    # Add current user message
-    intent_prompt.append({"role": "user", "content": user_message})
+    return intent_text
+
+async def classify_message(user_message, topic_name):
+    """Detect the intent and, for question requests, the specific topic in one OpenAI call.
+
+    Returns (intent_text, question_topic); question_topic is None when it still has to be
+    extracted separately, i.e. for local classifications and malformed replies.
+    """
+    # Keyword rules don't extract a topic, so the caller does that for local classifications
+    local_intent = intent_router.classify(user_message)
+    if local_intent:
+        logger.debug("Local intent detection: '%s' for message: '%s'", local_intent, user_message)
+        return local_intent, None
+    
+    classification_prompt = [
+        {"role": "system", "content": ChatPrompts.combined_classification_prompt()},
+        *_CLASSIFICATION_EXAMPLES,
+        ChatPrompts.learning_topic_message(topic_name),
+        {"role": "user", "content": user_message}
+    ]
     
-    # Get intent classification from OpenAI
-    intent_response = await create_openai_completion(messages=intent_prompt)
-    intent_text = intent_response.choices[0].message.content.strip().lower()
-    print(f"Intent detection: '{intent_text}' for message: '{user_message}'")
+    classification_content = await cached_completion(
+        make_key("classify", topic_name, user_message),
+        classification_prompt,
+        cache=_is_cacheable(user_message),
+        model=FAST_MODEL,
+        max_tokens=64,
+        temperature=0,
+        response_format={"type": "json_object"}
+    )
     
-    return intent_text
+    try:
+        classification = json.loads(classification_content)
+        intent_text = str(classification["intent"]).strip().lower()
+    except (json.JSONDecodeError, KeyError, TypeError):
+        # Fall back to the separate intent call; the topic is then extracted on its own
+        logger.warning("Malformed classification reply, falling back to intent detection: %s", classification_content)
+        return await detect_intent(user_message, topic_name), None
+    
+    logger.debug("Classification: '%s' for message: '%s'", intent_text, user_message)
+    if "question_generation" not in intent_text:
+        return intent_text, None
+    return intent_text, _resolve_question_topic(classification.get("specific_topic"), topic_name)
 
-async def check_short_response_context(user_message, intent_text, conversation_id):
+async def check_short_response_context(user_message, intent_text, history):
     """Check if a short response is answering a previous question in the conversation"""
     # Check for simple/short responses that might be answering a previous question
     is_simple_response = len(user_message.strip().split()) <= 3 and intent_text == "off_topic"
     in_conversation = False
     
-    if is_simple_response and conversation_id:
-        # Get conversation history to check context
-        history = MongoDBConversationManager.get_conversation_history(conversation_id)
+    if is_simple_response and history:
+        # Only the most recent AI message matters, so search back from the end
+        last_ai_message = next((msg for msg in reversed(history) if msg.get("sender") == MessageSenders.AI), None)
         
-        # Check if there's previous context where the AI asked a question
-        if history and len(history) > 0:
-            # Get the most recent AI message
-            ai_messages = [msg for msg in history if msg.get("sender") == MessageSenders.AI]
-            if ai_messages:
-                last_ai_message = ai_messages[-1]
-                last_ai_content = last_ai_message.get("content", "")
-                
-                # Check if the last AI message ended with a question mark or contains common question phrases
-                question_indicators = ["?", "can you", "do you", "could you", "would you", "how about", "have you"]
-                for indicator in question_indicators:
-                    if indicator in last_ai_content.lower():
-                        print(f"Short response '{user_message}' appears to be answering AI's previous question")
-                        # Override the off-topic classification
-                        intent_text = "general_chat"
-                        in_conversation = True
-                        break
+        if last_ai_message:
+            # Messages stored before the was_question flag existed are checked for question phrases
+            was_question = last_ai_message.get("was_question")
+            if was_question is None:
+                was_question = _asks_question(last_ai_message.get("content", ""))
+            if was_question:
+                logger.debug("Short response '%s' appears to be answering AI's previous question", user_message)
+                # Override the off-topic classification
+                intent_text = "general_chat"
+                in_conversation = True
     
     return intent_text, in_conversation
 
-async def handle_off_topic(user_message, conversation_id, topic_name, preferred_language="English"):
-    """Handle off-topic messages with a redirect to Portuguese learning"""
-    # Store the message in conversation history
-    MongoDBConversationManager.add_message(
-        conversation_id=conversation_id,
-        message={
-            "sender": MessageSenders.USER,
-            "content": user_message,
-            "timestamp": datetime.now().isoformat()
-        }
-    )
-    
-    # Generate a contextual response redirecting to Portuguese learning
-    # using OpenAI instead of hardcoded response
-    redirect_prompt = [
+# Off-topic replies are only a polite redirect, so canned ones are used unless this is enabled
+# or there are none for the user's language
+OFF_TOPIC_USE_LLM = os.getenv("OFF_TOPIC_USE_LLM", "false").lower() in ("1", "true", "yes")
+
+def static_off_topic_response(user_message, topic_name, preferred_language):
+    """A canned redirect in the user's language, or None when OpenAI should write one"""
+    templates = () if OFF_TOPIC_USE_LLM else ChatPrompts.off_topic_templates(preferred_language)
+    if not templates:
+        return None
+    # Pick by message so the same message always gets the same reply
+    template = templates[zlib.crc32(normalize(user_message).encode("utf-8")) % len(templates)]
+    return template.format(topic=html.escape(topic_name))
+
+# Redirects written by OpenAI are pooled per topic and language; once a pool holds
+# OFF_TOPIC_POOL_MIN of them, further off-topic messages get one at random without an API call
+OFF_TOPIC_POOL_MIN = 5
+OFF_TOPIC_POOL_SIZE = 10
+_off_topic_pools = TTLCache(maxsize=256, ttl=3600)
+
+def pooled_off_topic_response(topic_name, preferred_language):
+    """A previously generated redirect for the topic and language, or None while the pool is filling"""
+    pool = _off_topic_pools.get(make_key("off_topic_pool", topic_name, preferred_language), ())
+    return random.choice(pool) if len(pool) >= OFF_TOPIC_POOL_MIN else None
+
+def _pool_off_topic_response(topic_name, preferred_language, off_topic_response):
+    """Add a generated redirect to its pool, keeping the newest OFF_TOPIC_POOL_SIZE and skipping failures"""
+    if off_topic_response.startswith(OPENAI_ERROR_PREFIX):
+        return
+    key = make_key("off_topic_pool", topic_name, preferred_language)
+    pool = _off_topic_pools.get(key, [])
+    if off_topic_response not in pool:
+        _off_topic_pools.set(key, (pool + [off_topic_response])[-OFF_TOPIC_POOL_SIZE:])
+
+async def _iter_once(text):
+    yield text
+
+def off_topic_prompt(user_message, topic_name, preferred_language):
+    """OpenAI messages for a contextual reply redirecting the user to Portuguese learning"""
+    return [
         {"role": "system", "content": ChatPrompts.off_topic_redirect_prompt(topic_name, preferred_language)},
         {"role": "user", "content": user_message}
     ]
-    
-    # Get response from OpenAI
-    redirect_response = await create_openai_completion(messages=redirect_prompt)
-    off_topic_response = redirect_response.choices[0].message.content
-    
-    MongoDBConversationManager.add_message(
-        conversation_id=conversation_id,
-        message={
-            "sender": MessageSenders.AI,
-            "content": off_topic_response,
-            "timestamp": datetime.now().isoformat(),
-            "type": ResponseType.TEXT,
-            "payload": {"text": off_topic_response}
-        }
-    )
-    
-    # Return the response
-    result = {
+
+def off_topic_result(off_topic_response, topic_name):
+    """Response body for an off-topic redirect"""
+    return {
         "type": "text",
         "intent": "off_topic",
         "message": off_topic_response,
         "topic": "Portuguese learning",
         "topic_name": topic_name
     }
-    return result
+
+async def handle_off_topic(user_message, conversation_id, topic_name, preferred_language="English"):
+    """Handle off-topic messages with a redirect to Portuguese learning"""
+    # One timestamp for both messages of this request
+    now_iso = datetime.now().isoformat()
+    
+    # Use a canned or pooled redirect, or get one from OpenAI (repeated messages are served from cache)
+    off_topic_response = (
+        static_off_topic_response(user_message, topic_name, preferred_language)
+        or pooled_off_topic_response(topic_name, preferred_language)
+    )
+    if off_topic_response is None:
+        off_topic_response = await cached_completion(
+            make_key("off_topic", topic_name, preferred_language, user_message),
+            off_topic_prompt(user_message, topic_name, preferred_language),
+            cache=_is_cacheable(user_message)
+        )
+        _pool_off_topic_response(topic_name, preferred_language, off_topic_response)
+    
+    # Store the message and response in the background so the reply isn't held up by the write
+    _add_messages_in_background(conversation_id, text_exchange_messages(user_message, off_topic_response, now_iso))
+    
+    return off_topic_result(off_topic_response, topic_name)
 
 async def extract_question_type(intent_text):
     """Extract question type from intent text"""
@@ -161,55 +352,141 @@ async def extract_question_type(intent_text):
     if "question_generation" in intent_text:
         if ":multiple_choice" in intent_text:
             question_type = [QuestionTypes.MULTIPLE_CHOICE]
-            print(f"Multiple choice question type detected")
+            logger.debug("Multiple choice question type detected")
         else:  # Default to fill in the blanks if multiple choice not specifically requested
             question_type = [QuestionTypes.FILL_IN_THE_BLANKS]
-            print(f"Fill in the blanks question type selected (default or requested)")
+            logger.debug("Fill in the blanks question type selected (default or requested)")
     return question_type
 
 async def extract_specific_topic(user_message, topic_name):
     """Extract specific topic from user message"""
+    # Requests that name no topic or an obvious one are resolved without OpenAI
+    local_topic = topic_extractor.extract(user_message, topic_name)
+    if local_topic:
+        return _resolve_question_topic(local_topic, topic_name)
+    
     # Try to extract a more specific topic from the user message
     topic_extraction_prompt = [
-        {"role": "system", "content": ChatPrompts.topic_extraction_prompt(topic_name)}
+        {"role": "system", "content": ChatPrompts.topic_extraction_prompt(topic_name)},
+        *_TOPIC_EXAMPLES,
+        {"role": "user", "content": user_message}
     ]
     
-    # Add topic extraction examples
-    topic_extraction_prompt.extend(ChatPrompts.topic_extraction_examples())
-    
-    # Add current user message
-    topic_extraction_prompt.append({"role": "user", "content": user_message})
-    
     # Get the specific topic from the user message
-    topic_response = await create_openai_completion(messages=topic_extraction_prompt)
-    extracted_topic = topic_response.choices[0].message.content.strip()
-    
-    # Use the extracted topic if it seems valid
+    topic_content = await cached_completion(
+        make_key("topic", topic_name, user_message),
+        topic_extraction_prompt,
+        cache=_is_cacheable(user_message),
+        model=FAST_MODEL,
+        max_tokens=32,
+        temperature=0
+    )
+    return _resolve_question_topic(topic_content, topic_name)
+
+def _resolve_question_topic(extracted_topic, topic_name):
+    """Use the extracted topic if it seems valid, otherwise the topic name from CMS"""
+    extracted_topic = str(extracted_topic or "").strip()
     if extracted_topic and len(extracted_topic) > 3 and extracted_topic.lower() != "portuguese":
-        question_topic = extracted_topic
-        print(f"Extracted specific topic: '{question_topic}' from user message")
-    else:
-        # If we couldn't extract a specific topic, use the topic name from CMS
-        question_topic = topic_name
-        print(f"Using topic name from CMS: '{question_topic}'")
+        logger.debug("Extracted specific topic: '%s' from user message", extracted_topic)
+        return extracted_topic
     
-    return question_topic
+    # If we couldn't extract a specific topic, use the topic name from CMS
+    logger.debug("Using topic name from CMS: '%s'", topic_name)
+    return topic_name
 
-async def generate_and_process_questions(
-    user_message, 
-    conversation_id, 
-    question_topic, 
-    num_questions, 
-    difficulty, 
-    question_type, 
-    topic_name,
-    cms_prompt
-):
-    """Generate questions and process them for response"""
-    print(f"Generating questions with topic={question_topic}, num_questions={num_questions}, difficulty={difficulty}, question_types={question_type}")
-    
-    # Make sure we convert difficulty to string for the response
+# Generated questions are pooled per topic, difficulty, question type and CMS prompt so repeat
+# requests can be served without calling OpenAI; a pool is only sampled once it holds several
+# times the requested number of questions the conversation hasn't seen yet, so users still see
+# variety, and it keeps being topped up in the background until it is full. Keying on the CMS
+# prompt means editing a topic prompt starts a fresh pool.
+QUESTION_POOL_TTL = float(os.getenv("QUESTION_POOL_TTL", "86400"))
+QUESTION_POOL_SIZE = 50
+_QUESTION_POOL_FACTOR = 3
+_question_pools = TTLCache(maxsize=256, ttl=QUESTION_POOL_TTL)
+# Pools with a top-up in flight, so concurrent requests don't each generate one
+_question_pool_top_ups = set()
+
+# Words that don't change what a topic is about, so "Portuguese verbs" and "the verbs" share a pool
+_TOPIC_FILLER_WORDS = frozenset({"a", "an", "the", "in", "of", "on", "about", "portuguese", "português"})
+
+def _pool_topic(question_topic):
+    """Topic without case, punctuation or filler words, falling back to the normalized topic"""
+    words = [word for word in _PUNCTUATION_RE.sub(" ", question_topic.lower()).split() if word not in _TOPIC_FILLER_WORDS]
+    return " ".join(words) or normalize(question_topic)
+
+def _question_pool_key(question_topic, difficulty, question_type, cms_prompt):
     difficulty_str = difficulty.value if hasattr(difficulty, 'value') else difficulty
+    return make_key("questions", _pool_topic(question_topic), difficulty_str, *[t.value for t in question_type], cms_prompt)
+
+def _served_question_keys(history):
+    """Normalised text of the questions shown in the conversation's recent history.
+
+    Pooled questions get a new ID every time they are served, so the text is what identifies them.
+    """
+    served = set()
+    for message in history:
+        for question in (message.get("payload") or {}).get("questions", []):
+            if question.get("type") == QuestionTypes.MULTIPLE_CHOICE.value:
+                served.add(_text_key(question.get("questionText")))
+            else:
+                served.add(_text_key(question.get("questionSentence")))
+    return served
+
+def _add_to_question_pool(pool_key, questions):
+    """Grow the pool with the questions it doesn't already hold; a full pool drops its oldest questions"""
+    pool = _question_pools.get(pool_key, [])
+    seen = {_question_key(q) for q in pool}
+    _question_pools.set(pool_key, _add_unique(questions, list(pool), seen)[-QUESTION_POOL_SIZE:])
+
+async def _top_up_question_pool(pool_key, question_topic, num_questions, difficulty, question_type, cms_prompt):
+    try:
+        questions = await _generate_question_set(question_topic, num_questions, difficulty, question_type, cms_prompt)
+        _add_to_question_pool(pool_key, questions)
+    except Exception:
+        logger.exception("Error topping up the question pool for topic=%s", question_topic)
+    finally:
+        _question_pool_top_ups.discard(pool_key)
+
+def _top_up_question_pool_in_background(pool_key, question_topic, num_questions, difficulty, question_type, cms_prompt):
+    """Add a batch of fresh questions to a pool that isn't full yet, without making the caller wait"""
+    if pool_key in _question_pool_top_ups:
+        return
+    _question_pool_top_ups.add(pool_key)
+    task = asyncio.create_task(
+        _top_up_question_pool(pool_key, question_topic, num_questions, difficulty, question_type, cms_prompt)
+    )
+    _background_writes.add(task)
+    task.add_done_callback(_background_writes.discard)
+
+async def generate_question_set(question_topic, num_questions, difficulty, question_type, cms_prompt, exclude_keys=()):
+    """Get de-duplicated questions from the topic's pool, or generate them and add them to the pool.
+
+    Pooled questions whose normalised text is in exclude_keys (those the conversation has already seen) are not served.
+    Kept free of side effects on the conversation so it can run speculatively and be cancelled safely.
+    """
+    pool_key = _question_pool_key(question_topic, difficulty, question_type, cms_prompt)
+    pool = _question_pools.get(pool_key, [])
+    candidates = [q for q in pool if _question_key(q) not in exclude_keys]
+    if len(candidates) >= min(num_questions * _QUESTION_POOL_FACTOR, QUESTION_POOL_SIZE):
+        logger.debug("Serving %d questions from %d unseen in the pool for topic=%s", num_questions, len(candidates), question_topic)
+        if len(pool) < QUESTION_POOL_SIZE:
+            _top_up_question_pool_in_background(pool_key, question_topic, num_questions, difficulty, question_type, cms_prompt)
+        # Each serving gets its own question IDs, so answer records never mix learners or conversations
+        return [
+            q.model_copy(update={"id": uuid.uuid4().hex})
+            for q in random.sample(candidates, min(num_questions, len(candidates)))
+        ]
+    
+    questions = await _generate_question_set(question_topic, num_questions, difficulty, question_type, cms_prompt)
+    _add_to_question_pool(pool_key, questions)
+    return questions
+
+async def _generate_question_set(question_topic, num_questions, difficulty, question_type, cms_prompt):
+    """Generate and de-duplicate questions with OpenAI"""
+    logger.debug(
+        "Generating questions with topic=%s, num_questions=%s, difficulty=%s, question_types=%s",
+        question_topic, num_questions, difficulty, question_type
+    )
     
     # Add cms_prompt to the question generation context if available
     if cms_prompt:
@@ -217,18 +494,14 @@ async def generate_and_process_questions(
         question_generator.configure_custom_prompt(
             ChatPrompts.question_generation_prompt(question_topic, cms_prompt)
         )
-        print("Using custom CMS prompt for question generation")
+        logger.debug("Using custom CMS prompt for question generation")
     
     try:
-        # For multiple choice questions, let's generate more to ensure we get enough unique ones
-        adjusted_num_questions = num_questions
-        if question_type[0] == QuestionTypes.MULTIPLE_CHOICE:
-            adjusted_num_questions = num_questions * 3  # Generate 3x as many to ensure uniqueness
-            print(f"Adjusted number of questions for multiple choice to {adjusted_num_questions} to ensure {num_questions} unique questions")
-        
-        questions = question_generator.generate_questions(
+        # Each question gets its own focus angle, so only the requested number is generated;
+        # any duplicates are topped up with targeted retries in ensure_enough_questions
+        questions = await question_generator.agenerate_questions(
             topic=question_topic,
-            num_questions=adjusted_num_questions,
+            num_questions=num_questions,
             difficulty=difficulty,
             question_types=question_type
         )
@@ -236,44 +509,62 @@ async def generate_and_process_questions(
         # Reset the custom prompt after generating questions
         if cms_prompt:
             question_generator.configure_custom_prompt(None)
-            print("Reset custom prompt in question generator")
+            logger.debug("Reset custom prompt in question generator")
     
     # Process questions for uniqueness and fallbacks
-    processed_questions = await process_generated_questions(questions, num_questions, difficulty, question_type, question_topic)
+    return await process_generated_questions(questions, num_questions, difficulty, question_type, question_topic)
+
+async def generate_and_process_questions(
+    user_message, 
+    conversation_id, 
+    question_topic, 
+    num_questions, 
+    difficulty, 
+    question_type, 
+    topic_name,
+    cms_prompt,
+    processed_questions=None,
+    exclude_keys=()
+):
+    """Generate questions and process them for response"""
+    # One timestamp for both messages of this request
+    now_iso = datetime.now().isoformat()
     
-    # Store the message and response in the conversation history
-    MongoDBConversationManager.add_message(
-        conversation_id=conversation_id,
-        message={
-            "sender": MessageSenders.USER,
-            "content": user_message,
-            "timestamp": datetime.now().isoformat()
-        }
-    )
+    # Make sure we convert difficulty to string for the response
+    difficulty_str = difficulty.value if hasattr(difficulty, 'value') else difficulty
     
-    # Add AI message with questions to conversation history
+    # Questions may already have been generated speculatively by process_message
+    if processed_questions is None:
+        processed_questions = await generate_question_set(
+            question_topic, num_questions, difficulty, question_type, cms_prompt, exclude_keys
+        )
+    
+    # Serialise the questions once for both the stored message and the response
+    all_questions = [q.model_dump(mode="json") for q in processed_questions]
+    
+    # Store the message and the AI message with questions in the background
     response_content = f"Here are some questions about {question_topic}:"
-    MongoDBConversationManager.add_message(
-        conversation_id=conversation_id,
-        message={
-            "sender": MessageSenders.AI,
-            "content": response_content,
-            "timestamp": datetime.now().isoformat(),
-            "type": ResponseType.QUESTION,
-            "payload": {
-                "questions": [q.dict() for q in processed_questions]
+    _add_messages_in_background(
+        conversation_id,
+        [
+            {
+                "sender": MessageSenders.USER,
+                "content": user_message,
+                "timestamp": now_iso
+            },
+            {
+                "sender": MessageSenders.AI,
+                "content": response_content,
+                "timestamp": now_iso,
+                "was_question": False,
+                "type": ResponseType.QUESTION,
+                "payload": {
+                    "questions": all_questions
+                }
             }
-        }
+        ]
     )
     
-    # Create lists for the response
-    all_questions = []
-    for q in processed_questions:
-        try:
-            all_questions.append(q.dict())
-        except Exception as e:
-            print(f"Error converting question to dict: {str(e)}")
-    
     # Return the questions in a format based on the question type
     result = {
         "type": "question",
@@ -285,148 +576,111 @@ async def generate_and_process_questions(
         "topic_name": topic_name
     }
     
-    print(f"Returning result with {len(all_questions)} questions")
+    logger.debug("Returning result with %d questions", len(all_questions))
     return result
 
 async def process_generated_questions(questions, num_questions, difficulty, question_type, question_topic):
     """Process generated questions for uniqueness and add fallbacks if needed"""
     if not questions:
-        print("Warning: No questions were generated. Using fallback questions.")
+        logger.warning("No questions were generated. Using fallback questions.")
         return await generate_fallback_questions(num_questions, difficulty, question_type, question_topic)
     
-    # Ensure we have unique questions
-    unique_questions = []
-    question_texts = set()
-    
-    for q in questions:
-        if q is None:
-            print("Warning: Found None question, skipping")
-            continue
-            
-        try:
-            # For multiple choice, check questionText
-            if q.type == QuestionTypes.MULTIPLE_CHOICE and q.questionText not in question_texts:
-                unique_questions.append(q)
-                question_texts.add(q.questionText)
-            # For fill in the blanks, check questionSentence
-            elif q.type == QuestionTypes.FILL_IN_THE_BLANKS and q.questionSentence not in question_texts:
-                unique_questions.append(q)
-                question_texts.add(q.questionSentence)
-        except Exception as e:
-            print(f"Error processing question: {str(e)}")
-            continue
+    # Ensure we have unique questions; the seen keys are shared with the top-up below
+    seen = set()
+    unique_questions = _add_unique(questions, [], seen)
     
     # If we still don't have enough unique questions after initial generation,
     # generate more using direct method calls
     unique_questions = await ensure_enough_questions(
-        unique_questions, question_texts, num_questions, difficulty, question_type, question_topic
+        unique_questions, seen, num_questions, difficulty, question_type, question_topic
     )
     
     # Ensure we have exactly the right number of questions
     if len(unique_questions) > num_questions:
         unique_questions = unique_questions[:num_questions]
-        print(f"Trimmed to exactly {num_questions} questions as requested")
+        logger.debug("Trimmed to exactly %d questions as requested", num_questions)
     
     return unique_questions
 
-async def ensure_enough_questions(unique_questions, question_texts, num_questions, difficulty, question_type, question_topic):
-    """Ensure we have enough unique questions by generating more if needed"""
-    attempts = 0
-    max_direct_attempts = 5  # Increased from 3 to give more chances for AI generation
-    
-    while len(unique_questions) < num_questions and attempts < max_direct_attempts:
-        attempts += 1
-        print(f"Direct generation attempt {attempts}/{max_direct_attempts} to reach {num_questions} questions")
+async def ensure_enough_questions(unique_questions, seen, num_questions, difficulty, question_type, question_topic):
+    """Top up the questions with one concurrent batch if the first batch left a shortfall"""
+    needed = num_questions - len(unique_questions)
+    if needed > 0:
+        logger.debug("Generating %d more questions to reach %d", needed, num_questions)
         
-        try:
-            if question_type[0] == QuestionTypes.MULTIPLE_CHOICE:
-                # Generate one more directly using the generator method
-                # Modify the topic slightly to encourage uniqueness
-                generation_topic = f"{question_topic} (variation {attempts})"
-                new_question = question_generator.generate_multiple_choice_question(
-                    difficulty=difficulty,
-                    topic=generation_topic
-                )
-                
-                if new_question and new_question.questionText not in question_texts:
-                    unique_questions.append(new_question)
-                    question_texts.add(new_question.questionText)
-                    print(f"Added unique multiple choice question. Now have {len(unique_questions)}/{num_questions}")
-            else:
-                # Generate one more fill in the blank question directly
-                # Modify the topic slightly to encourage uniqueness
-                generation_topic = f"{question_topic} (variation {attempts})"
-                new_question = question_generator.generate_fill_in_blank_question(
-                    difficulty=difficulty,
-                    topic=generation_topic
+        # Generate the whole shortfall concurrently, with fresh focus angles and the
+        # existing questions listed so the model avoids repeating them
+        avoid = [_question_text(q) for q in unique_questions]
+        results = await asyncio.gather(
+            *[
+                question_generator.agenerate_question(
+                    question_type[0],
+                    difficulty,
+                    diversify_topic(question_topic, num_questions + i),
+                    avoid
                 )
-                
-                if new_question and new_question.questionSentence not in question_texts:
-                    unique_questions.append(new_question)
-                    question_texts.add(new_question.questionSentence)
-                    print(f"Added unique fill-in-the-blank question. Now have {len(unique_questions)}/{num_questions}")
-        except Exception as e:
-            print(f"Error generating additional question directly: {str(e)}")
+                for i in range(needed)
+            ],
+            return_exceptions=True
+        )
+        
+        for new_question in results:
+            if isinstance(new_question, Exception):
+                logger.error("Error generating additional question directly: %s", new_question)
+        _add_unique((q for q in results if not isinstance(q, Exception)), unique_questions, seen)
+        logger.debug("Now have %d/%d unique questions", len(unique_questions), num_questions)
     
     # If we still don't have enough questions, log it but don't add hardcoded questions
     if len(unique_questions) < num_questions:
-        print(f"Warning: Could only generate {len(unique_questions)} unique questions out of {num_questions} requested")
+        logger.warning("Could only generate %d unique questions out of %d requested", len(unique_questions), num_questions)
     
     return unique_questions
 
 async def generate_fallback_questions(num_questions, difficulty, question_type, question_topic):
     """Generate fallback questions using AI with different prompts when initial generation failed"""
-    fallback_questions = []
+    # Use varied topics to ensure uniqueness
+    if question_type[0] == QuestionTypes.MULTIPLE_CHOICE:
+        fallback_topics = [
+            "common Portuguese greeting expressions",
+            "Portuguese nouns and their genders",
+            "basic Portuguese vocabulary",
+            "Portuguese language fundamentals",
+            "everyday Portuguese phrases"
+        ]
+    else:
+        fallback_topics = [
+            "basic Portuguese verb conjugation",
+            "Portuguese sentence structure",
+            "common Portuguese expressions",
+            "Portuguese adjectives",
+            "Portuguese prepositions"
+        ]
     
-    # Try with a more specific prompt
-    for i in range(num_questions):
-        try:
-            if question_type[0] == QuestionTypes.MULTIPLE_CHOICE:
-                # Generate with varied topics to ensure uniqueness
-                fallback_topics = [
-                    "common Portuguese greeting expressions",
-                    "Portuguese nouns and their genders",
-                    "basic Portuguese vocabulary",
-                    "Portuguese language fundamentals",
-                    "everyday Portuguese phrases"
-                ]
-                
-                topic = fallback_topics[i % len(fallback_topics)]
-                # Force a higher temperature setting to get more varied results
-                question = question_generator.generate_multiple_choice_question(
-                    difficulty=difficulty, 
-                    topic=topic
-                )
-                if question:
-                    fallback_questions.append(question)
-            else:
-                # Generate fill in the blank question with varied topics
-                fallback_topics = [
-                    "basic Portuguese verb conjugation",
-                    "Portuguese sentence structure",
-                    "common Portuguese expressions",
-                    "Portuguese adjectives",
-                    "Portuguese prepositions"
-                ]
-                
-                topic = fallback_topics[i % len(fallback_topics)]
-                question = question_generator.generate_fill_in_blank_question(
-                    difficulty=difficulty,
-                    topic=topic
-                )
-                if question:
-                    fallback_questions.append(question)
-        except Exception as e:
-            print(f"Error generating fallback question {i+1}: {str(e)}")
-            continue
+    # Try with a more specific prompt, generating all fallbacks concurrently
+    results = await asyncio.gather(
+        *[
+            question_generator.agenerate_question(
+                question_type[0],
+                difficulty,
+                fallback_topics[i % len(fallback_topics)]
+            )
+            for i in range(num_questions)
+        ],
+        return_exceptions=True
+    )
     
-    print(f"Generated {len(fallback_questions)} fallback questions using AI")
+    fallback_questions = []
+    for i, question in enumerate(results):
+        if isinstance(question, Exception):
+            logger.error("Error generating fallback question %d: %s", i + 1, question)
+        elif question:
+            fallback_questions.append(question)
+    
+    logger.debug("Generated %d fallback questions using AI", len(fallback_questions))
     return fallback_questions
 
-async def handle_general_chat(user_message, conversation_id, topic_name, cms_prompt, preferred_language="English"):
-    """Handle general chat interactions"""
-    print(f"Processing general chat for topic: {topic_name}")
-    
+def build_general_chat_context(user_message, history, topic_name, cms_prompt, preferred_language, rolling_summary=None):
+    """Build the OpenAI messages for a general chat reply: system prompt, summary of older messages, recent history and the new message"""
     # Create context with topic to maintain the conversation focus and incorporate CMS prompt
     system_prompt = ChatPrompts.general_chat_prompt(topic_name, cms_prompt, preferred_language)
 
@@ -435,11 +689,11 @@ async def handle_general_chat(user_message, conversation_id, topic_name, cms_pro
         {"role": "system", "content": system_prompt}
     ]
     
-    # Get conversation history to maintain context
-    history = MongoDBConversationManager.get_conversation_history(conversation_id)
-    print(f"Got history with {len(history)} messages")
+    # Messages older than the window are only sent as their summary
+    if rolling_summary:
+        context_messages.append(ChatPrompts.conversation_summary_message(rolling_summary["summary"]))
     
-    # Use all messages for context
+    # Use the recent messages for context
     for msg in history:
         if msg.get("sender") == MessageSenders.USER:
             context_messages.append({"role": "user", "content": msg.get("content", "")})
@@ -448,52 +702,222 @@ async def handle_general_chat(user_message, conversation_id, topic_name, cms_pro
     
     # Add current message
     context_messages.append({"role": "user", "content": user_message})
-    print(f"Created context with {len(context_messages)} messages")
-    
-    # Generate AI response
-    print("Calling OpenAI API...")
-    response = await create_openai_completion(messages=context_messages)
-    ai_message = response.choices[0].message.content
-    print(f"Got response: {ai_message[:50]}...")
-    
-    # Store the user message in conversation history
-    MongoDBConversationManager.add_message(
-        conversation_id=conversation_id,
-        message={
+    logger.debug("Created context with %d messages", len(context_messages))
+    return context_messages
+
+def general_chat_cache_key(user_message, topic_name, cms_prompt, preferred_language, history, rolling_summary):
+    """Cache key for a general chat reply, or None when the reply depends on earlier turns.
+
+    Only opening messages are answered from cache: once there is history, the same message
+    can need a different reply in every conversation.
+    """
+    if history or rolling_summary or not _is_cacheable(user_message):
+        return None
+    return make_key("general_chat", topic_name, cms_prompt, preferred_language, user_message)
+
+def text_exchange_messages(user_message, ai_message, now_iso):
+    """The user message and text AI reply of one exchange, as stored in the conversation"""
+    return [
+        {
             "sender": MessageSenders.USER,
             "content": user_message,
-            "timestamp": datetime.now().isoformat()
-        }
-    )
-    
-    # Store the AI response in conversation history
-    print("Adding AI message to conversation history")
-    MongoDBConversationManager.add_message(
-        conversation_id=conversation_id,
-        message={
+            "timestamp": now_iso
+        },
+        {
             "sender": MessageSenders.AI,
             "content": ai_message,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now_iso,
+            "was_question": _asks_question(ai_message),
             "type": ResponseType.TEXT,
             "payload": {"text": ai_message}
         }
-    )
-    
-    # Return the response with HTML formatting preserved
-    result = {
+    ]
+
+def general_chat_result(ai_message, topic_name):
+    """Response body for a general chat reply, with HTML formatting preserved"""
+    return {
         "type": "text",
         "intent": "general_chat",
         "message": ai_message,  # This will contain the HTML tags
         "topic": topic_name,
         "topic_name": topic_name,
     }
-    return result
 
-# Process user message with context
-@router.post("/process-message", 
-          summary="Process user message with topic context", 
-          description="Process user message maintaining topic context and detecting intent for questions or general chat")
-async def process_message(message_data: ProcessMessage, user=Depends(get_current_user)):
+async def handle_general_chat(user_message, conversation_id, topic_name, cms_prompt, preferred_language="English", history=(), rolling_summary=None):
+    """Handle general chat interactions"""
+    # One timestamp for both messages of this request
+    now_iso = datetime.now().isoformat()
+
+    logger.debug("Processing general chat for topic: %s", topic_name)
+    context_messages = build_general_chat_context(
+        user_message, history, topic_name, cms_prompt, preferred_language, rolling_summary
+    )
+    
+    # Generate AI response (common opening messages are served from cache)
+    logger.debug("Calling OpenAI API...")
+    cache_key = general_chat_cache_key(user_message, topic_name, cms_prompt, preferred_language, history, rolling_summary)
+    if cache_key:
+        ai_message = await cached_completion(cache_key, context_messages)
+    else:
+        response = await create_openai_completion(messages=context_messages)
+        ai_message = response.choices[0].message.content
+    logger.debug("Got response: %.50s...", ai_message)
+    
+    # Store the user message and the AI response in the background so the reply isn't held up by the write
+    logger.debug("Adding messages to conversation history")
+    _add_messages_in_background(conversation_id, text_exchange_messages(user_message, ai_message, now_iso))
+    _refresh_summary_in_background(conversation_id, history, rolling_summary)
+    
+    return general_chat_result(ai_message, topic_name)
+
+# Conversations whose summary is being refreshed, so concurrent replies don't summarize twice
+_summarizing = set()
+
+async def refresh_rolling_summary(conversation_id, rolling_summary=None):
+    """Fold the messages that have dropped out of the history window into the conversation's summary"""
+    message_count = await asyncio.to_thread(MongoDBConversationManager.count_messages, conversation_id)
+    summarized_count = rolling_summary["summarized_count"] if rolling_summary else 0
+    older_count = message_count - HISTORY_WINDOW
+    if older_count <= summarized_count:
+        return
+    
+    # Only the messages between the summary and the window are read, however long the conversation
+    unsummarized = await asyncio.to_thread(
+        MongoDBConversationManager.get_messages, conversation_id, summarized_count, older_count - summarized_count
+    )
+    transcript = "\n".join(
+        f"{'Learner' if msg.get('sender') == MessageSenders.USER else 'Tutor'}: {msg.get('content', '')}"
+        for msg in unsummarized
+    )
+    if rolling_summary:
+        transcript = f"Previous summary: {rolling_summary['summary']}\n\n{transcript}"
+    
+    response = await create_openai_completion(
+        messages=[
+            {"role": "system", "content": ChatPrompts.conversation_summary_prompt()},
+            {"role": "user", "content": transcript}
+        ],
+        model=FAST_MODEL,
+        max_tokens=300,
+        temperature=0
+    )
+    if getattr(response, "error", None):
+        logger.warning("Could not summarize conversation %s: %s", conversation_id, response.error)
+        return
+    
+    summary = response.choices[0].message.content.strip()
+    await asyncio.to_thread(
+        MongoDBConversationManager.update_rolling_summary, conversation_id, summary, older_count
+    )
+    logger.debug("Summarized %d messages of conversation %s", older_count, conversation_id)
+
+async def _refresh_summary_task(conversation_id, rolling_summary):
+    try:
+        await refresh_rolling_summary(conversation_id, rolling_summary)
+    except Exception:
+        logger.exception("Error refreshing summary of conversation %s", conversation_id)
+    finally:
+        _summarizing.discard(conversation_id)
+
+def _refresh_summary_in_background(conversation_id, history, rolling_summary):
+    """Refresh the summary of older messages after a reply, once the history window is full"""
+    # A partly filled window means there are no older messages to summarize yet
+    if len(history) < HISTORY_WINDOW or conversation_id in _summarizing:
+        return
+    _summarizing.add(conversation_id)
+    task = asyncio.create_task(_refresh_summary_task(conversation_id, rolling_summary))
+    _background_writes.add(task)
+    task.add_done_callback(_background_writes.discard)
+
+def stream_error_result(partial_message):
+    """Final event body for a streamed reply that failed partway; the message is the partial text and fallback"""
+    return {
+        "type": "error",
+        "message": partial_message,
+    }
+
+def _sse_event(data, event=None):
+    """Format one server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {orjson.dumps(data).decode()}\n\n"
+
+async def stream_general_chat(user_message, conversation_id, topic_name, cms_prompt, preferred_language="English", history=(), rolling_summary=None):
+    """Stream a general chat reply as server-sent events, storing the exchange once it is complete"""
+    now_iso = datetime.now().isoformat()
+    
+    logger.debug("Streaming general chat for topic: %s", topic_name)
+    context_messages = build_general_chat_context(
+        user_message, history, topic_name, cms_prompt, preferred_language, rolling_summary
+    )
+    
+    # Send each piece of the reply as soon as OpenAI produces it; cached opening replies arrive as a single piece
+    # completed only receives the reply once it has streamed to the end
+    completed = []
+    cache_key = general_chat_cache_key(user_message, topic_name, cms_prompt, preferred_language, history, rolling_summary)
+    if cache_key:
+        deltas = cached_stream(cache_key, context_messages, on_complete=completed.append)
+    else:
+        deltas = stream_openai_completion(messages=context_messages, on_complete=completed.append)
+    parts = []
+    async for delta in deltas:
+        parts.append(delta)
+        yield _sse_event({"delta": delta})
+    ai_message = "".join(parts)
+    
+    if not completed:
+        # The reply failed partway and ends in the fallback text, so it is neither stored nor a result
+        yield _sse_event(stream_error_result(ai_message), event="error")
+        return
+    
+    # Store the exchange in the background so the write doesn't hold up closing the stream
+    _add_messages_in_background(conversation_id, text_exchange_messages(user_message, ai_message, now_iso))
+    _refresh_summary_in_background(conversation_id, history, rolling_summary)
+    
+    yield _sse_event(general_chat_result(ai_message, topic_name), event="done")
+
+async def stream_off_topic(user_message, conversation_id, topic_name, preferred_language="English"):
+    """Stream an off-topic redirect as server-sent events, storing the exchange once it is complete"""
+    now_iso = datetime.now().isoformat()
+    
+    # Canned, pooled and cached replies arrive as a single piece, new ones as OpenAI produces them
+    canned_response = (
+        static_off_topic_response(user_message, topic_name, preferred_language)
+        or pooled_off_topic_response(topic_name, preferred_language)
+    )
+    # completed only receives the reply once it has streamed to the end
+    completed = []
+    if canned_response is not None:
+        deltas = _iter_once(canned_response)
+        completed.append(canned_response)
+    else:
+        deltas = cached_stream(
+            make_key("off_topic", topic_name, preferred_language, user_message),
+            off_topic_prompt(user_message, topic_name, preferred_language),
+            cache=_is_cacheable(user_message),
+            on_complete=completed.append
+        )
+    parts = []
+    async for delta in deltas:
+        parts.append(delta)
+        yield _sse_event({"delta": delta})
+    off_topic_response = "".join(parts)
+    
+    if not completed:
+        # The reply failed partway and ends in the fallback text, so it is neither stored, pooled nor a result
+        yield _sse_event(stream_error_result(off_topic_response), event="error")
+        return
+    if canned_response is None:
+        _pool_off_topic_response(topic_name, preferred_language, off_topic_response)
+    
+    _add_messages_in_background(conversation_id, text_exchange_messages(user_message, off_topic_response, now_iso))
+    
+    yield _sse_event(off_topic_result(off_topic_response, topic_name), event="done")
+
+async def _process_message(message_data, user, stream=False):
+    """Route a user message to off-topic, question generation or general chat handling.
+
+    With stream=True off-topic and general chat replies are returned as async generators of server-sent events.
+    """
     try:
         # Extract data from request
         conversation_id = message_data.conversation_id
@@ -502,37 +926,80 @@ async def process_message(message_data: ProcessMessage, user=Depends(get_current
         difficulty = message_data.difficulty
         num_questions = message_data.num_questions
         
-        # Get user settings
-        preferred_language = await extract_user_settings(user)
-        
-        # Get topic prompt from CMS
-        cms_prompt, topic_name = await fetch_topic_prompt(topic_ids)
+        # Get user settings, topic prompt from CMS and recent history concurrently; the history
+        # is read once here and shared by the short-response check and general chat
+        # Only a window of recent turns, plus a summary of older ones, is used so prompt size
+        # stays bounded in long conversations
+        preferred_language, (cms_prompt, topic_name), history, rolling_summary = await asyncio.gather(
+            extract_user_settings(user),
+            fetch_topic_prompt(topic_ids),
+            _get_conversation_history(conversation_id, HISTORY_WINDOW),
+            _get_rolling_summary(conversation_id)
+        )
         
-        print(f"Process message request: conversation_id={conversation_id}, message='{user_message}', topic_ids='{topic_ids}', preferred_language='{preferred_language}'")
+        logger.debug(
+            "Process message request: conversation_id=%s, message='%s', topic_ids='%s', preferred_language='%s'",
+            conversation_id, user_message, topic_ids, preferred_language
+        )
         
-        # Detect intent
-        intent_text = await detect_intent(user_message, topic_name)
+        # Detect intent, and the specific topic for question requests, in a single call
+        intent_text, question_topic = await classify_message(user_message, topic_name)
         
         # Check context for short responses
-        intent_text, in_conversation = await check_short_response_context(user_message, intent_text, conversation_id)
+        intent_text, in_conversation = await check_short_response_context(user_message, intent_text, history)
         
         # Handle off-topic messages
         if intent_text == "off_topic":
-            print("Detected off-topic request")
+            logger.debug("Detected off-topic request")
+            if stream:
+                return stream_off_topic(user_message, conversation_id, topic_name, preferred_language)
             return await handle_off_topic(user_message, conversation_id, topic_name, preferred_language)
         
         # Determine if this is a question generation request
         is_question_intent = "question_generation" in intent_text
-        print(f"Question intent detected: {is_question_intent}, full intent: {intent_text}")
+        logger.debug("Question intent detected: %s, full intent: %s", is_question_intent, intent_text)
         
         # Extract question type if needed
         question_type = await extract_question_type(intent_text)
         
+        # Pooled questions the conversation has already seen are not served again
         if is_question_intent:
-            # Extract specific topic from user message
-            question_topic = await extract_specific_topic(user_message, topic_name)
+            served_keys = _served_question_keys(history)
+        
+        if is_question_intent and question_topic is not None:
+            # The classification already named the topic
+            return await generate_and_process_questions(
+                user_message, 
+                conversation_id, 
+                question_topic, 
+                num_questions, 
+                difficulty, 
+                question_type, 
+                topic_name,
+                cms_prompt,
+                exclude_keys=served_keys
+            )
+        elif is_question_intent:
+            # Most requests stay on the lesson topic, so start generating for it while the
+            # specific topic is still being extracted and only regenerate if it changes
+            topic_task = asyncio.create_task(extract_specific_topic(user_message, topic_name))
+            speculative_task = asyncio.create_task(
+                generate_question_set(topic_name, num_questions, difficulty, question_type, cms_prompt, served_keys)
+            )
+            try:
+                question_topic = await topic_task
+            except BaseException:
+                speculative_task.cancel()
+                raise
+            
+            processed_questions = None
+            if question_topic.strip().lower() == topic_name.strip().lower():
+                question_topic = topic_name
+                processed_questions = await speculative_task
+            else:
+                speculative_task.cancel()
             
-            # Generate and process questions
+            # Store and return the questions, generating them for the new topic if needed
             return await generate_and_process_questions(
                 user_message, 
                 conversation_id, 
@@ -541,17 +1008,61 @@ async def process_message(message_data: ProcessMessage, user=Depends(get_current
                 difficulty, 
                 question_type, 
                 topic_name,
-                cms_prompt
+                cms_prompt,
+                processed_questions,
+                served_keys
+            )
+        elif stream:
+            # Stream general chat token by token
+            return stream_general_chat(
+                user_message, conversation_id, topic_name, cms_prompt, preferred_language, history, rolling_summary
             )
         else:
             # Handle general chat
-            return await handle_general_chat(user_message, conversation_id, topic_name, cms_prompt, preferred_language)
+            return await handle_general_chat(
+                user_message, conversation_id, topic_name, cms_prompt, preferred_language, history, rolling_summary
+            )
             
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error processing message: {str(e)}\n{error_details}")
+        logger.exception("Error processing message: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Error processing message: {str(e)}"
         )
+
+# Process user message with context
+# A retry of a submission still in flight (double click, client retry) can send the same
+# Idempotency-Key header to share its processing run, so the message is answered, and the exchange
+# stored, only once. Without the header every request is processed: identical messages from two
+# tabs are separate sends
+_message_inflight = SingleFlight()
+
+@router.post("/process-message", 
+          summary="Process user message with topic context", 
+          description="Process user message maintaining topic context and detecting intent for questions or general chat. "
+                      "Requests from the same user with the same Idempotency-Key header while one is still "
+                      "being processed share its response")
+async def process_message(
+    message_data: ProcessMessage,
+    user=Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    if not idempotency_key:
+        return await _process_message(message_data, user)
+    return await _message_inflight.do((str(user["_id"]), idempotency_key), _process_message, message_data, user)
+
+async def _single_event(result):
+    """Send an already complete response as the final server-sent event"""
+    yield _sse_event(result, event="done")
+
+@router.post("/process-message/stream",
+          summary="Process user message and stream the reply",
+          description="Same as /process-message, but returns server-sent events: general chat and off-topic replies arrive as "
+                      "'delta' chunks while they are generated, and every response ends with a 'done' event "
+                      "carrying the full result, or an 'error' event if the reply failed partway")
+async def process_message_stream(message_data: ProcessMessage, user=Depends(get_current_user)):
+    result = await _process_message(message_data, user, stream=True)
+    
+    # Question responses are produced whole, so they are sent as a single event
+    events = _single_event(result) if isinstance(result, dict) else result
+    return StreamingResponse(events, media_type="text/event-stream")
@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query
 from typing import Dict, Any, List, Optional
+import asyncio
+import os
 import uuid
 from datetime import datetime
 
@@ -8,7 +10,8 @@ from models import (
     ConversationCreate, ConversationResponse, ConversationListResponse,
     ConversationHistoryResponse, Message, GetOrCreateConversation,
 )
-from database import MongoDBConversationManager
+from database import MongoDBConversationManager, conversations_collection
+from cache import TTLCache
 
 # Initialize router
 router = APIRouter(
@@ -17,6 +20,35 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# Title and description never change after creation, so they are kept in memory briefly for
+# conversations that are read repeatedly; missing conversations aren't cached, so one created
+# elsewhere is found straight away
+CONVERSATION_CACHE_TTL = float(os.getenv("CONVERSATION_CACHE_TTL", "60"))
+_conversation_cache = TTLCache(maxsize=1024, ttl=CONVERSATION_CACHE_TTL)
+
+async def cached_get_conversation(conversation_id: str) -> Optional[Dict[str, Any]]:
+    """Get a conversation's title and description, from memory when recently read"""
+    conversation = _conversation_cache.get(conversation_id)
+    if conversation is None:
+        conversation = await asyncio.to_thread(MongoDBConversationManager.get_conversation, conversation_id)
+        if conversation:
+            conversation = {
+                "title": conversation.get("title", "Untitled"),
+                "description": conversation.get("description", "")
+            }
+            _conversation_cache.set(conversation_id, conversation)
+    return conversation
+
+# PyMongo is synchronous, so the endpoints run its calls in a worker thread to keep the event loop free
+def _find_user_conversations(user_id: str, limit: int, skip: int) -> List[Dict[str, Any]]:
+    """One page of a user's conversations, with only the listed fields"""
+    return list(
+        conversations_collection.find(
+            {"user_id": user_id},
+            {"conversation_id": 1, "title": 1, "description": 1, "created_at": 1, "updated_at": 1, "_id": 0}
+        ).sort("updated_at", -1).skip(skip).limit(limit)
+    )
+
 # Create conversation endpoint
 @router.post("", response_model=ConversationResponse)
 async def create_conversation(conversation: ConversationCreate):
@@ -24,13 +56,14 @@ async def create_conversation(conversation: ConversationCreate):
         # Get conversation_id from request if provided
         provided_id = conversation.conversation_id
         
-        # Check if this ID exists in our database
-        if provided_id and MongoDBConversationManager.get_conversation(provided_id):
+        # Check if this ID exists in our database, reading the conversation only once
+        existing = await cached_get_conversation(provided_id) if provided_id else None
+        if existing:
             # Conversation exists, return it
             return ConversationResponse(
                 conversation_id=provided_id,
-                title=MongoDBConversationManager.get_conversation(provided_id).get("title", "Untitled"),
-                description=MongoDBConversationManager.get_conversation(provided_id).get("description", ""),
+                title=existing.get("title", "Untitled"),
+                description=existing.get("description", ""),
                 status="success",
                 message="Existing conversation retrieved"
             )
@@ -44,12 +77,14 @@ async def create_conversation(conversation: ConversationCreate):
         description = conversation.description if conversation.description else "General conversation about Portuguese language"
         user_id = conversation.user_id if conversation.user_id else "default_user"
         
-        MongoDBConversationManager.create_conversation(
+        await asyncio.to_thread(
+            MongoDBConversationManager.create_conversation,
             conversation_id=conversation_id,
             title=title,
             description=description,
             user_id=user_id
         )
+        _conversation_cache.pop(conversation_id)
         
         return ConversationResponse(
             conversation_id=conversation_id,
@@ -64,37 +99,34 @@ async def create_conversation(conversation: ConversationCreate):
             detail=f"Error creating conversation: {str(e)}"
         )
 
+# Stored message fields copied into the response only when present
+_OPTIONAL_MESSAGE_FIELDS = ("id", "type", "payload")
+
 # Get conversation history endpoint
 @router.get("/{conversation_id}", response_model=ConversationHistoryResponse)
 async def get_conversation_history(conversation_id: str, limit: int = Query(50, ge=1, le=100)):
     """Get conversation history with the specified ID"""
     try:
-        # Get conversation data
-        conversation = MongoDBConversationManager.get_conversation(conversation_id)
+        # Get conversation data and history together
+        conversation = await asyncio.to_thread(
+            MongoDBConversationManager.get_conversation_with_history, conversation_id, limit
+        )
         if not conversation:
             raise HTTPException(status_code=404, detail=f"Conversation with ID {conversation_id} not found")
+        messages = conversation["messages"]
         
-        # Get conversation history
-        messages = MongoDBConversationManager.get_conversation_history(conversation_id, limit)
-        
-        # Format messages for response
-        formatted_messages = []
-        for msg in messages:
-            formatted_msg = Message(
+        # Format messages for response; they are validated once against the response model,
+        # so building each one doesn't validate it again
+        formatted_messages = [
+            Message.model_construct(
                 sender=msg.get("sender"),
                 content=msg.get("content", ""),
-                timestamp=msg.get("timestamp")
+                timestamp=msg.get("timestamp"),
+                # Add optional fields if present
+                **{field: msg[field] for field in _OPTIONAL_MESSAGE_FIELDS if field in msg}
             )
-            
-            # Add optional fields if present
-            if "id" in msg:
-                formatted_msg.id = msg["id"]
-            if "type" in msg:
-                formatted_msg.type = msg["type"]
-            if "payload" in msg:
-                formatted_msg.payload = msg["payload"]
-            
-            formatted_messages.append(formatted_msg)
+            for msg in messages
+        ]
         
         # Create and return response
         return ConversationHistoryResponse(
@@ -110,14 +142,18 @@ async def get_conversation_history(conversation_id: str, limit: int = Query(50,
 
 # List user's conversations
 @router.get("", response_model=ConversationListResponse)
-async def list_conversations(user_id: str = "default_user"):
-    """List all conversations for a user"""
+async def list_conversations(
+    user_id: str = "default_user",
+    limit: int = Query(50, ge=1, le=200),
+    skip: int = Query(0, ge=0)
+):
+    """List a user's conversations, most recently updated first"""
     try:
-        # Get all conversations for the user from MongoDB
-        from database import conversations_collection
-        conversations = list(conversations_collection.find({"user_id": user_id}))
+        # Get one page of the user's conversations from MongoDB
+        conversations = await asyncio.to_thread(_find_user_conversations, user_id, limit, skip)
         
-        # Format conversations for response
+        # Format conversations for response; conversations written without timestamps all share one fallback
+        now_iso = datetime.now().isoformat()
         formatted_conversations = []
         for conv in conversations:
             formatted_conversations.append(
@@ -125,8 +161,8 @@ async def list_conversations(user_id: str = "default_user"):
                     conversation_id=conv.get("conversation_id"),
                     title=conv.get("title", "Untitled"),
                     description=conv.get("description", ""),
-                    created_at=conv.get("created_at").isoformat() if "created_at" in conv else datetime.now().isoformat(),
-                    updated_at=conv.get("updated_at").isoformat() if "updated_at" in conv else datetime.now().isoformat()
+                    created_at=conv["created_at"].isoformat() if "created_at" in conv else now_iso,
+                    updated_at=conv["updated_at"].isoformat() if "updated_at" in conv else now_iso
                 )
             )
         
@@ -144,17 +180,16 @@ async def get_or_create_conversation(conversation_data: GetOrCreateConversation)
         # Get the conversation ID from the request
         conversation_id = conversation_data.conversation_id
         
-        # Check if this ID exists in MongoDB
-        conversation = MongoDBConversationManager.get_conversation(conversation_id)
+        # Check if this ID exists in MongoDB, fetching its history in the same round-trip
+        conversation = await asyncio.to_thread(MongoDBConversationManager.get_conversation_with_history, conversation_id)
         
         if conversation:
             # Conversation exists, return its history
-            messages = MongoDBConversationManager.get_conversation_history(conversation_id)
             return ConversationHistoryResponse(
                 conversation_id=conversation_id,
                 title=conversation.get("title", "Untitled"),
                 description=conversation.get("description", ""),
-                messages=messages
+                messages=conversation["messages"]
             )
         else:
             # Create a new conversation with the provided ID
@@ -162,12 +197,14 @@ async def get_or_create_conversation(conversation_data: GetOrCreateConversation)
             description = conversation_data.description
             user_id = conversation_data.user_id
             
-            MongoDBConversationManager.create_conversation(
+            await asyncio.to_thread(
+                MongoDBConversationManager.create_conversation,
                 conversation_id=conversation_id,
                 title=title,
                 description=description,
                 user_id=user_id
             )
+            _conversation_cache.pop(conversation_id)
             
             return ConversationHistoryResponse(
                 conversation_id=conversation_id,
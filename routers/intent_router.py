@@ -0,0 +1,100 @@
+"""
+Local intent classification for the chat router.
+Obvious question requests and small talk are recognised here in microseconds;
+anything these rules don't cover falls through to the OpenAI classifier.
+"""
+
+import functools
+import re
+from typing import Optional
+
+from routers.prompts import ChatPrompts
+
+__all__ = ["classify", "lookup_key"]
+
+# Question-request keywords only count when the user asks to practise, as rule 1 of the intent
+# prompt says: either the message is nothing but the keyword ("quiz", "fill in the blanks") or it
+# is phrased as a request ("quiz me", "give me an exercise", "let's practice"). A message that
+# merely mentions one ("what does exercise mean?", "I went to the gym to exercise") is left to the LLM.
+_FILL_IN_THE_BLANKS = r"fill[\s-]+in(?:[\s-]+the)?[\s-]+blanks?"
+_QUESTION_KEYWORD = (
+    rf"(?:{_FILL_IN_THE_BLANKS}|mcqs?|multiple[\s-]+choice|quiz(?:zes)?|exercises?|practi[cs]e|questions?|test)"
+)
+_KEYWORD_ONLY_RE = re.compile(rf"(?:portuguese\s+)?{_QUESTION_KEYWORD}(?:\s+questions?)?(?:\s+portuguese)?")
+# What can be asked for: one question set with an article ("a quiz", "an exercise") or several
+# ("exercises", "5 mcqs", "some fill in the blanks"); a bare singular like "i need exercise" isn't a request
+_REQUESTED_QUESTIONS = (
+    r"(?:(?:a|an|another|one)\s+(?:portuguese\s+)?(?:quiz|test|exercise|question|mcq|multiple[\s-]+choice\s+question)"
+    rf"|(?:(?:some|more|\d+)\s+)?(?:portuguese\s+)?(?:{_FILL_IN_THE_BLANKS}|mcqs|multiple[\s-]+choice(?:\s+questions)?"
+    r"|quizzes|exercises|questions))"
+)
+# The whole message must be the request, optionally followed by its topic ("quiz me on verbs")
+# or the language; anything else after it ("a test drive", "let's practice my car") goes to the LLM
+_QUESTION_REQUEST_RE = re.compile(
+    r"(?:please\s+)?(?:(?:can|could|will|would)\s+you\s+)?"
+    r"(?:quiz\s+me|test\s+me|test\s+my\s+(?:portuguese|knowledge|grammar|vocabulary)|teach\s+me\s+with\s+questions"
+    r"|let'?s\s+practi[cs]e|(?:i\s+(?:want|need)\s+to|i'?d\s+like\s+to)\s+(?:practi[cs]e|exercise)"
+    r"|(?:give\s+me|send\s+me|i\s+(?:want|need)|i'?d\s+like|let'?s\s+(?:do|have)|can\s+i\s+(?:have|get|do))"
+    rf"\s+{_REQUESTED_QUESTIONS})"
+    r"(?:\s+in\s+portuguese)?(?:\s+(?:on|about|with)\s+[\w' -]+)?(?:\s+please)?[\s!?,]*"
+)
+_FILL_IN_THE_BLANKS_RE = re.compile(rf"\b{_FILL_IN_THE_BLANKS}\b")
+
+# Questions about a word itself ("how do you say practice?", "translate 'quiz'") are never requests
+_WORD_QUESTION_RE = re.compile(
+    r"\b(?:how\s+(?:do|would|can|should)\s+(?:you|i)\s+(?:say|translate|spell|pronounce|use)|what\s+does"
+    r"|means?|meaning|translat\w*|is\s+\S+\s+a\s+(?:portuguese\s+)?word)"
+)
+
+# Greetings, thanks and short answers in English or Portuguese are always general chat,
+# but only when they are the whole message
+_SMALL_TALK_RE = re.compile(
+    r"(?:hi|hello|hey|thanks|thank\s+you|ok(?:ay)?|yes|no|sure|maybe|ol[aá]|oi|obrigad[oa]|sim"
+    r"|n[aã]o|tudo\s+bem)\b[\s!.?,]*"
+)
+
+# Longer messages carry more context than keywords can judge, so leave them to the LLM
+_LOCAL_INTENT_MAX_WORDS = 8
+
+
+def lookup_key(user_message: str) -> str:
+    """Lowercased message without surrounding whitespace, trailing punctuation or repeated spaces"""
+    return " ".join(user_message.lower().split()).rstrip(".!?")
+
+
+# The labelled few-shot examples answer themselves; this also covers longer examples the keyword
+# rules skip and phrasings like "teach me" whose label depends on the exact wording
+_EXAMPLE_INTENTS = {
+    lookup_key(message["content"]): label["content"]
+    for message, label in zip(
+        ChatPrompts.intent_classification_examples()[::2],
+        ChatPrompts.intent_classification_examples()[1::2]
+    )
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def _classify_key(key: str) -> Optional[str]:
+    example_intent = _EXAMPLE_INTENTS.get(key)
+    if example_intent:
+        return example_intent
+    if len(key.split()) > _LOCAL_INTENT_MAX_WORDS:
+        return None
+    if _SMALL_TALK_RE.fullmatch(key):
+        return "general_chat"
+    if _WORD_QUESTION_RE.search(key):
+        return None
+    if _KEYWORD_ONLY_RE.fullmatch(key) or _QUESTION_REQUEST_RE.fullmatch(key):
+        # Gap-fill requests often mention quizzes or practice too, so they take precedence
+        if _FILL_IN_THE_BLANKS_RE.search(key):
+            return "question_generation:fill_in_the_blanks"
+        return "question_generation:multiple_choice"
+    return None
+
+
+def classify(user_message: str) -> Optional[str]:
+    """Classify obvious question requests and small talk without an OpenAI call, or return None.
+
+    Messages differing only in case, spacing or trailing punctuation share one cached result.
+    """
+    return _classify_key(lookup_key(user_message))
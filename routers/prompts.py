@@ -3,37 +3,200 @@ Centralized prompt management for the Portuguese learning application.
 This module contains all prompts used across the application.
 """
 
+import functools
+import re
+
+__all__ = ["ChatPrompts"]
+
+# Few-shot examples never change, so they are built once as immutable tuples
+_INTENT_CLASSIFICATION_EXAMPLES = (
+    {"role": "user", "content": "mcqs"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "mcq"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "Give me multiple choice questions"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "Give me a quiz about Portuguese verbs"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "exercise"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "I want to exercise Portuguese grammar"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "practice Portuguese"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "test my Portuguese"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "give me exercises"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "I need to practice Portuguese"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "How do you say 'hello' in Portuguese?"},
+    {"role": "assistant", "content": "general_chat"},
+    {"role": "user", "content": "Can you explain the most common Portuguese verbs?"},
+    {"role": "assistant", "content": "general_chat"},
+    {"role": "user", "content": "I need multiple choice questions for Portuguese vocabulary"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "What are the most used nouns in Portuguese?"},
+    {"role": "assistant", "content": "general_chat"},
+    {"role": "user", "content": "Test my knowledge of Portuguese grammar with fill in the blank questions"},
+    {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
+    {"role": "user", "content": "I want to practice Portuguese through a quiz"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "What's the weather like today?"},
+    {"role": "assistant", "content": "off_topic"},
+    {"role": "user", "content": "Yes"},
+    {"role": "assistant", "content": "general_chat"},
+    {"role": "user", "content": "No, I can't"},
+    {"role": "assistant", "content": "general_chat"},
+    {"role": "user", "content": "Maybe later"},
+    {"role": "assistant", "content": "general_chat"},
+    {"role": "user", "content": "fill in the blanks"},
+    {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
+    {"role": "user", "content": "Fill in the blanks"},
+    {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
+    {"role": "user", "content": "fill in the blank"},
+    {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
+    {"role": "user", "content": "Fill in the blank questions"},
+    {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
+    {"role": "user", "content": "Correct my sentence"},
+    {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
+    {"role": "user", "content": "Teach me"},
+    {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
+    {"role": "user", "content": "Correct my sentence in Portuguese"},
+    {"role": "assistant", "content": "general_chat"},
+    {"role": "user", "content": "Teach me about Portuguese verbs"},
+    {"role": "assistant", "content": "general_chat"},
+    {"role": "user", "content": "Quiz me"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "Quiz"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "Test me"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "test me on Portuguese"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "quiz me on verbs"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "quiz me on grammar"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"},
+    {"role": "user", "content": "teach me with questions"},
+    {"role": "assistant", "content": "question_generation:multiple_choice"}
+)
+
+_TOPIC_EXTRACTION_EXAMPLES = (
+    {"role": "user", "content": "Give me questions about Portuguese verb conjugation"},
+    {"role": "assistant", "content": "Portuguese verb conjugation"},
+    {"role": "user", "content": "I want to practice Portuguese greetings"},
+    {"role": "assistant", "content": "Portuguese greetings"},
+    {"role": "user", "content": "Test me on days of the week in Portuguese"},
+    {"role": "assistant", "content": "Days of the week in Portuguese"},
+    {"role": "user", "content": "Can I have 5 fill in the blank questions about Portuguese prepositions?"},
+    {"role": "assistant", "content": "Portuguese prepositions"}
+)
+
+_COMBINED_CLASSIFICATION_EXAMPLES = (
+    {"role": "user", "content": "Give me a quiz about Portuguese verbs"},
+    {"role": "assistant", "content": '{"intent": "question_generation:multiple_choice", "specific_topic": "Portuguese verbs"}'},
+    {"role": "user", "content": "I want to practice Portuguese greetings"},
+    {"role": "assistant", "content": '{"intent": "question_generation:multiple_choice", "specific_topic": "Portuguese greetings"}'},
+    {"role": "user", "content": "I need to practice Portuguese"},
+    {"role": "assistant", "content": '{"intent": "question_generation:multiple_choice", "specific_topic": null}'},
+    {"role": "user", "content": "Can I have 5 fill in the blank questions about Portuguese prepositions?"},
+    {"role": "assistant", "content": '{"intent": "question_generation:fill_in_the_blanks", "specific_topic": "Portuguese prepositions"}'},
+    {"role": "user", "content": "Test me on days of the week in Portuguese"},
+    {"role": "assistant", "content": '{"intent": "question_generation:multiple_choice", "specific_topic": "Days of the week in Portuguese"}'},
+    {"role": "user", "content": "How do you say 'hello' in Portuguese?"},
+    {"role": "assistant", "content": '{"intent": "general_chat", "specific_topic": null}'},
+    {"role": "user", "content": "Teach me about Portuguese verbs"},
+    {"role": "assistant", "content": '{"intent": "general_chat", "specific_topic": null}'},
+    {"role": "user", "content": "Correct my sentence in Portuguese"},
+    {"role": "assistant", "content": '{"intent": "general_chat", "specific_topic": null}'},
+    {"role": "user", "content": "No, I can't"},
+    {"role": "assistant", "content": '{"intent": "general_chat", "specific_topic": null}'},
+    {"role": "user", "content": "What's the weather like today?"},
+    {"role": "assistant", "content": '{"intent": "off_topic", "specific_topic": null}'}
+)
+
+
+# Indentation of the triple-quoted templates below only costs tokens, so it is stripped when a
+# prompt is built; the builders are memoised, so this runs once per distinct prompt. CMS-authored
+# prompts are joined on afterwards, never passed through it, so their indentation is kept
+_INDENT_RE = re.compile(r"^[ \t]+|[ \t]+$", re.M)
+
+def _strip_indent(prompt):
+    """Prompt text without leading and trailing whitespace on each line"""
+    return _INDENT_RE.sub("", prompt).strip()
+
+
+# The HTML tag instruction, worded identically in every prompt that produces user-facing text
+_HTML_TAG_RULE = """YOU MUST format ALL responses in HTML without doctype tag. Use these HTML tags:
+        - <div> for main content sections
+        - <p> for paragraphs
+        - <ul> and <li> for lists
+        - <strong> or <b> for emphasis
+        - <em> or <i> for italics
+        - <span> for inline styling
+        - <br> for line breaks"""
+
+# HTML formatting rules 3-6, shared verbatim by the chat-facing system prompts
+_HTML_FORMAT_RULES = f"""3. {_HTML_TAG_RULE}
+        4. Always wrap Portuguese words or phrases in <strong> tags.
+        5. Use <ul> and <li> for lists of examples or explanations.
+        6. Keep the HTML clean and semantic."""
+
+
+# Canned off-topic redirects by preferred language; {topic} is the HTML-escaped learning topic
+_OFF_TOPIC_TEMPLATES = {
+    "english": (
+        "<div><p>That's an interesting question, but I'm here to help you learn Portuguese! "
+        "Let's get back to <strong>{topic}</strong>.</p><p>What would you like to know about it?</p></div>",
+        "<div><p>I can only help with Portuguese language learning. Shall we continue with "
+        "<strong>{topic}</strong>?</p><p>You can ask me for an explanation, some examples or a quick quiz.</p></div>",
+        "<div><p>Let's keep our focus on Portuguese! We're currently studying <strong>{topic}</strong>.</p>"
+        "<p>Ask me anything about it, or say <em>quiz me</em> to practise.</p></div>",
+    ),
+    "portuguese": (
+        "<div><p>Essa é uma pergunta interessante, mas estou aqui para ajudar você a aprender português! "
+        "Vamos voltar a <strong>{topic}</strong>.</p><p>O que você gostaria de saber sobre isso?</p></div>",
+        "<div><p>Só posso ajudar com o aprendizado de português. Vamos continuar com "
+        "<strong>{topic}</strong>?</p><p>Você pode pedir uma explicação, alguns exemplos ou um pequeno quiz.</p></div>",
+        "<div><p>Vamos manter o foco no português! Estamos estudando <strong>{topic}</strong>.</p>"
+        "<p>Pergunte qualquer coisa sobre isso ou diga <em>quiz me</em> para praticar.</p></div>",
+    ),
+}
+
+
 class ChatPrompts:
     @staticmethod
-    def default_system_prompt(preferred_language="English"):
-        return f"""You are an AI assistant for Portuguese language learning. 
+    @functools.lru_cache(maxsize=256)
+    def default_system_prompt(preferred_language=None):
+        # The rules are the same for every user and the language comes last, so they form a prefix
+        # providers can cache. Without a language this is the base other prompts append theirs to.
+        prompt = f"""You are an AI assistant for Portuguese language learning. 
         ONLY respond to queries related to Portuguese language learning, Portuguese grammar, vocabulary, or culture.
         
         IMPORTANT RULES: 
-        1. Unless the user is asking about Portuguese content or vocabulary, respond in {preferred_language}.
+        1. Unless the user is asking about Portuguese content or vocabulary, respond in the user's preferred language given below.
         2. Portuguese words mentioned in examples or teachings should remain in Portuguese regardless of the response language.
-        3. YOU MUST format ALL responses in HTML without doctype tag. Use these HTML tags:
-           - <div> for main content sections
-           - <p> for paragraphs
-           - <ul> and <li> for lists
-           - <strong> or <b> for emphasis
-           - <em> or <i> for italics
-           - <span> for inline styling
-           - <br> for line breaks
-        4. Always wrap Portuguese words or phrases in <strong> tags.
-        5. Use <ul> and <li> for lists of examples or explanations.
-        6. Keep the HTML clean and semantic.
+        {_HTML_FORMAT_RULES}
         7. Break explanations into clear paragraphs to enhance readability.
         8. When introducing grammatical rules or vocabulary, always present examples as a list, ensuring clarity and ease of understanding.
         9. Where appropriate, include brief dialogues between Portuguese speakers to demonstrate natural conversation.
         10. Highlight key words, exceptions, or important concepts using bold or italics.
         11. If relevant, provide concise summaries at the end of each section (without lists).
         12. CRITICAL: EVERY response must be properly formatted in HTML with appropriate tags."""
+        if preferred_language:
+            prompt += f"""
+        
+        The user's preferred language is: {preferred_language}"""
+        return _strip_indent(prompt)
     
     @staticmethod
-    def intent_classification_prompt(topic_name):
-        # Intent classification doesn't need preferred language since it's an internal system classification
-        return f"""
+    @functools.lru_cache(maxsize=256)
+    def intent_classification_prompt():
+        # Intent classification doesn't need preferred language since it's an internal system classification.
+        # The learning topic is sent separately after the examples (see learning_topic_message) so this
+        # prompt and the examples form an identical prefix on every request, which providers can cache.
+        return _strip_indent("""
         You are a classifier for a Portuguese language learning app.
         Classify if the user message is asking for:
         - question_generation:multiple_choice - they want multiple choice questions about Portuguese
@@ -51,160 +214,119 @@ class ChatPrompts:
         7. Any non-Portuguese learning topics should be "off_topic"
         8. Messages in languages other than English or Portuguese should be "off_topic"
         
-        Current learning topic: {topic_name}
-        
         Return ONLY one of these classifications without any explanation.
-        """
+        """)
+    
+    @staticmethod
+    def learning_topic_message(topic_name):
+        """Trailing system message carrying the per-request learning topic"""
+        return {"role": "system", "content": f"Current learning topic: {topic_name}"}
     
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def conversation_summary_prompt():
+        return _strip_indent("""
+        Summarize this Portuguese lesson conversation between a learner and their tutor for the tutor's own reference.
+        Keep the topics covered, the vocabulary and grammar taught, mistakes the learner made and anything
+        the learner said about themselves or their goals. If a previous summary is given, fold it into the new one.
+        Reply with a short plain-text summary of at most 150 words, without HTML.
+        """)
+
+    @staticmethod
+    def conversation_summary_message(summary):
+        """System message carrying the summary of messages older than the history window"""
+        return {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+
     @staticmethod
     def intent_classification_examples():
-        return [
-            {"role": "user", "content": "mcqs"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "mcq"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "Give me multiple choice questions"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "Give me a quiz about Portuguese verbs"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "exercise"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "I want to exercise Portuguese grammar"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "practice Portuguese"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "test my Portuguese"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "give me exercises"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "I need to practice Portuguese"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "How do you say 'hello' in Portuguese?"},
-            {"role": "assistant", "content": "general_chat"},
-            {"role": "user", "content": "Can you explain the most common Portuguese verbs?"},
-            {"role": "assistant", "content": "general_chat"},
-            {"role": "user", "content": "I need multiple choice questions for Portuguese vocabulary"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "What are the most used nouns in Portuguese?"},
-            {"role": "assistant", "content": "general_chat"},
-            {"role": "user", "content": "Test my knowledge of Portuguese grammar with fill in the blank questions"},
-            {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
-            {"role": "user", "content": "I want to practice Portuguese through a quiz"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "What's the weather like today?"},
-            {"role": "assistant", "content": "off_topic"},
-            {"role": "user", "content": "Yes"},
-            {"role": "assistant", "content": "general_chat"},
-            {"role": "user", "content": "No, I can't"},
-            {"role": "assistant", "content": "general_chat"},
-            {"role": "user", "content": "Maybe later"},
-            {"role": "assistant", "content": "general_chat"},
-            {"role": "user", "content": "fill in the blanks"},
-            {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
-            {"role": "user", "content": "Fill in the blanks"},
-            {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
-            {"role": "user", "content": "fill in the blank"},
-            {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
-            {"role": "user", "content": "Fill in the blank questions"},
-            {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
-            {"role": "user", "content": "Correct my sentence"},
-            {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
-            {"role": "user", "content": "Teach me"},
-            {"role": "assistant", "content": "question_generation:fill_in_the_blanks"},
-            {"role": "user", "content": "Correct my sentence in Portuguese"},
-            {"role": "assistant", "content": "general_chat"},
-            {"role": "user", "content": "Teach me about Portuguese verbs"},
-            {"role": "assistant", "content": "general_chat"},
-            {"role": "user", "content": "Quiz me"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "Quiz"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "Test me"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "test me on Portuguese"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "quiz me on verbs"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "quiz me on grammar"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"},
-            {"role": "user", "content": "teach me with questions"},
-            {"role": "assistant", "content": "question_generation:multiple_choice"}
-        ]
+        return _INTENT_CLASSIFICATION_EXAMPLES
     
     @staticmethod
+    @functools.lru_cache(maxsize=256)
     def topic_extraction_prompt(topic_name):
         # Topic extraction doesn't need preferred language since it's an internal system classification
-        return f"""
+        return _strip_indent(f"""
         Extract the specific topic the user wants questions about from their message. 
         Pay special attention to any Portuguese grammar concepts, vocabulary categories, or language features mentioned.
         The user is currently studying: {topic_name}
         Return ONLY the topic, no extra text or explanation.
-        """
+        """)
     
     @staticmethod
     def topic_extraction_examples():
-        return [
-            {"role": "user", "content": "Give me questions about Portuguese verb conjugation"},
-            {"role": "assistant", "content": "Portuguese verb conjugation"},
-            {"role": "user", "content": "I want to practice Portuguese greetings"},
-            {"role": "assistant", "content": "Portuguese greetings"},
-            {"role": "user", "content": "Test me on days of the week in Portuguese"},
-            {"role": "assistant", "content": "Days of the week in Portuguese"},
-            {"role": "user", "content": "Can I have 5 fill in the blank questions about Portuguese prepositions?"},
-            {"role": "assistant", "content": "Portuguese prepositions"}
-        ]
+        return _TOPIC_EXTRACTION_EXAMPLES
+        
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def combined_classification_prompt():
+        # One call that does the work of intent classification and topic extraction. Like the
+        # intent prompt it is static; the learning topic follows the examples (learning_topic_message).
+        return _strip_indent("""
+        You are a classifier for a Portuguese language learning app.
+        Classify if the user message is asking for:
+        - question_generation:multiple_choice - they want multiple choice questions about Portuguese
+        - question_generation:fill_in_the_blanks - they want fill-in-the-blank exercises for Portuguese
+        - general_chat - they want to generally talk about Portuguese language or related topics
+        - off_topic - they're asking about something not related to Portuguese learning
+        
+        IMPORTANT RULES:
+        1. When user mentions "exercise", "practice", "quiz", "test", "mcq", "mcqs", "multiple choice" in context of Portuguese learning, classify as question_generation:multiple_choice
+        2. When user message EXACTLY matches "Correct my sentence" or "Teach me", classify as question_generation:fill_in_the_blanks
+        3. When user message contains phrases like "quiz me", "test me", "give me a quiz", "give me questions", "teach me with questions" or "quiz", classify as question_generation:multiple_choice
+        4. When user message contains additional context beyond "Correct my sentence" or "Teach me", check if it's still quiz-related before defaulting to general_chat
+        5. Short responses like "yes", "no", "maybe", "I can't", etc. should be classified as "general_chat"
+        6. Any non-Portuguese learning topics should be "off_topic"
+        7. Messages in languages other than English or Portuguese should be "off_topic"
+        
+        For question_generation intents, also extract the specific topic the user wants questions about,
+        paying special attention to any Portuguese grammar concepts, vocabulary categories, or language features mentioned.
+        Use null when the message names no specific topic or the intent is not question_generation.
         
+        Return ONLY a JSON object of the form {"intent": "<classification>", "specific_topic": "<topic or null>"}.
+        """)
+    
+    @staticmethod
+    def combined_classification_examples():
+        return _COMBINED_CLASSIFICATION_EXAMPLES
+    
     @staticmethod
+    @functools.lru_cache(maxsize=256)
     def off_topic_redirect_prompt(topic_name, preferred_language="English"):
-        return f"""
+        # Static instructions first and the per-request fields last, for the longest cacheable prefix
+        return _strip_indent(f"""
         You are a Portuguese language learning assistant.
         
         The user has asked a question that seems unrelated to Portuguese language learning.
-        Politely redirect them back to the topic of Portuguese language learning.
-        
-        The user is currently studying: {topic_name}
+        Politely redirect them back to the topic of Portuguese language learning they are studying, given below.
         
         IMPORTANT: 
-        1. Respond in {preferred_language}.
+        1. Respond in the user's preferred language given below.
         2. Be friendly but firm in redirecting to Portuguese language topics.
-        3. YOU MUST format ALL responses in HTML without doctype tag. Use these HTML tags:
-           - <div> for main content sections
-           - <p> for paragraphs
-           - <ul> and <li> for lists
-           - <strong> or <b> for emphasis
-           - <em> or <i> for italics
-           - <span> for inline styling
-           - <br> for line breaks
-        4. Always wrap Portuguese words or phrases in <strong> tags.
-        5. Use <ul> and <li> for lists of examples or explanations.
-        6. Keep the HTML clean and semantic.
+        {_HTML_FORMAT_RULES}
         7. CRITICAL: EVERY response must begin with HTML tags and maintain proper HTML structure throughout.
-        """
+        
+        The user is currently studying: {topic_name}
+        The user's preferred language is: {preferred_language}
+        """)
     
     @staticmethod
-    def general_chat_prompt(topic_name, cms_prompt, preferred_language="English"):
-        # Use CMS prompt if available, otherwise default prompt
-        base_prompt = cms_prompt if cms_prompt else ChatPrompts.default_system_prompt(preferred_language)
-        
-        return f"""{base_prompt}
-        
-        The user is currently learning about: {topic_name}
+    def off_topic_templates(preferred_language="English"):
+        """Canned off-topic redirects for a language, or an empty tuple when there are none"""
+        return _OFF_TOPIC_TEMPLATES.get(preferred_language.strip().lower(), ())
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _general_chat_base(cms_prompt):
+        """Base prompt and rules of general_chat_prompt, the same for every topic and language"""
+        # Use CMS prompt if available, otherwise default prompt; the language is stated at the end instead
+        base_prompt = cms_prompt if cms_prompt else ChatPrompts.default_system_prompt()
         
+        return f"{base_prompt}\n\n" + _strip_indent(f"""
         IMPORTANT: 
         1. Unless the user is asking for Portuguese content to be translated or explained, 
-           respond in {preferred_language}.
+           respond in the user's preferred language given below.
         2. Keep any Portuguese words or phrases that you're teaching in Portuguese.
-        3. YOU MUST format ALL responses in HTML without doctype tag. Use these HTML tags:
-           - <div> for main content sections
-           - <p> for paragraphs
-           - <ul> and <li> for lists
-           - <strong> or <b> for emphasis
-           - <em> or <i> for italics
-           - <span> for inline styling
-           - <br> for line breaks
-        4. Always wrap Portuguese words or phrases in <strong> tags.
-        5. Use <ul> and <li> for lists of examples or explanations.
-        6. Keep the HTML clean and semantic.
+        {_HTML_FORMAT_RULES}
         7. Provide feedback in a structured and accessible format for language learners.
         8. Break explanations into clear paragraphs to enhance readability.
         9. When introducing grammatical rules or vocabulary, always present examples as a list, ensuring clarity and ease of understanding.
@@ -212,18 +334,31 @@ class ChatPrompts:
         11. Highlight key words, exceptions, or important concepts using bold or italics.
         12. If relevant, provide concise summaries at the end of each section (without lists).
         13. Ensure feedback is clear, engaging, and suited to learners of varying levels.
-        14. CRITICAL: EVERY response must begin with HTML formatting and maintain proper HTML structure throughout."""
+        14. CRITICAL: EVERY response must begin with HTML formatting and maintain proper HTML structure throughout.""")
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def general_chat_prompt(topic_name, cms_prompt, preferred_language="English"):
+        # Static rules come right after the base prompt and the per-request fields come last,
+        # so every request on the same topic prompt shares the longest possible cacheable prefix.
+        # The base is built once per CMS prompt, so a new topic or language only appends its tail.
+        return (
+            f"{ChatPrompts._general_chat_base(cms_prompt)}\n\n"
+            f"The user is currently learning about: {topic_name}\n"
+            f"The user's preferred language is: {preferred_language}"
+        )
     
     @staticmethod
+    @functools.lru_cache(maxsize=256)
     def question_generation_prompt(topic, cms_prompt=None, preferred_language="English"):
         """Create a prompt for generating questions about a specific topic"""
         base_system = cms_prompt if cms_prompt else f"""You are an expert Portuguese language teacher."""
         
-        return f"""{base_system}
-        
-        Create challenging but fair Portuguese language questions about: {topic}
+        # As in general_chat_prompt, the topic and language come after the static instructions
+        return f"{base_system}\n\n" + _strip_indent(f"""
+        Create challenging but fair Portuguese language questions about the topic given below.
         
-        Question descriptions and instructions should be in {preferred_language}, but any Portuguese 
+        Question descriptions and instructions should be in the preferred language given below, but any Portuguese 
         content in the questions, answers and options should remain in Portuguese.
         
         For multiple choice questions:
@@ -233,19 +368,12 @@ class ChatPrompts:
         
         For fill-in-the-blank questions:
         - Create sentences in Portuguese with one blank marked as ____
-        - Make sure the answer tests knowledge of {topic}
+        - Make sure the answer tests knowledge of the topic
         - Provide the correct word or phrase that should fill the blank
         - Include a hint that helps guide the learner
         
         CRITICAL HTML FORMATTING REQUIREMENTS:
-        YOU MUST format ALL responses in HTML without doctype tag. Use these HTML tags:
-        - <div> for main content sections
-        - <p> for paragraphs
-        - <ul> and <li> for lists
-        - <strong> or <b> for emphasis
-        - <em> or <i> for italics
-        - <span> for inline styling
-        - <br> for line breaks
+        {_HTML_TAG_RULE}
         
         IMPORTANT FORMATTING GUIDELINES:
         - Always wrap Portuguese words or phrases in <strong> tags
@@ -255,4 +383,7 @@ class ChatPrompts:
         - If including dialogues, format them clearly with speaker indicators
         - Keep HTML clean and semantic
         - EVERY response MUST begin with HTML formatting and maintain proper HTML structure throughout
-        """                                          
\ No newline at end of file
+        
+        Topic: {topic}
+        Preferred language: {preferred_language}
+        """)                                          
\ No newline at end of file
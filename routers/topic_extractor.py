@@ -0,0 +1,68 @@
+"""
+Local topic extraction for question requests.
+Requests that name no topic, or name one with an obvious grammar or vocabulary keyword, are
+resolved here; anything else falls through to the OpenAI topic extraction call.
+"""
+
+import functools
+import re
+from typing import Optional
+
+from routers.intent_router import lookup_key
+from routers.prompts import ChatPrompts
+
+__all__ = ["extract"]
+
+# Words that only make up the request itself ("give me 5 multiple choice questions"), not a topic
+_REQUEST_WORDS = frozenset({
+    "a", "an", "the", "some", "more", "me", "my", "i", "to", "can", "could", "have", "want", "need", "please",
+    "give", "ask", "let's", "lets", "do", "on", "about", "with", "for", "of", "in", "portuguese", "português",
+    "quiz", "quizzes", "test", "mcq", "mcqs", "multiple", "choice", "question", "questions", "exercise",
+    "exercises", "practice", "practise", "fill", "blank", "blanks", "teach", "correct", "sentence",
+})
+
+# The topic follows "about", "on" or "with" and runs to the end of the message
+_TOPIC_PHRASE_RE = re.compile(r"\b(?:about|on|with)\s+(?P<topic>.+?)[\s?.!]*$", re.I)
+
+# A phrase is only trusted as a topic when it names something the app teaches
+_TOPIC_KEYWORDS_RE = re.compile(
+    r"\b(?:verbs?|nouns?|adjectives?|adverbs?|pronouns?|prepositions?|articles?|conjugations?|tenses?"
+    r"|subjunctive|imperative|plurals?|gender|grammar|vocabulary|greetings?|numbers?|colou?rs?|days?"
+    r"|months?|food|family|animals?|phrases?|expressions?|idioms?|pronunciation)\b",
+    re.I
+)
+
+
+# The few-shot examples answer themselves
+_EXAMPLE_TOPICS = {
+    lookup_key(message["content"]): topic["content"]
+    for message, topic in zip(
+        ChatPrompts.topic_extraction_examples()[::2],
+        ChatPrompts.topic_extraction_examples()[1::2]
+    )
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def _extract_key(key: str, topic_name: str) -> Optional[str]:
+    example_topic = _EXAMPLE_TOPICS.get(key)
+    if example_topic:
+        return example_topic
+
+    # Nothing but request words and counts, e.g. "quiz me" or "give me 5 mcqs": stay on the lesson topic
+    words = re.findall(r"[\w']+", key)
+    if all(word in _REQUEST_WORDS or word.isdigit() for word in words):
+        return topic_name
+
+    match = _TOPIC_PHRASE_RE.search(key)
+    if match and _TOPIC_KEYWORDS_RE.search(match["topic"]):
+        return match["topic"]
+    return None
+
+
+def extract(user_message: str, topic_name: str) -> Optional[str]:
+    """Extract the topic of a question request without an OpenAI call, or return None.
+
+    Messages differing only in case, spacing or trailing punctuation share one cached result.
+    """
+    return _extract_key(lookup_key(user_message), topic_name)
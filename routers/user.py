@@ -1,13 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional
+import asyncio
+import logging
 import uuid
 from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 # Import models and dependencies
 from models import (
     UserSettings, UserSettingsCreate, UserSettingsUpdate
 )
 from dependencies import get_current_user
+from database import db, has_unique_index
+
+logger = logging.getLogger(__name__)
 
 # Initialize router
 router = APIRouter(
@@ -16,20 +23,19 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# User settings endpoints
+# User settings endpoints; PyMongo is synchronous, so its calls run in a worker thread to keep the event loop free
 @router.get("/settings", summary="Get user settings")
 async def get_user_settings(user=Depends(get_current_user)):
     """Get settings for the current user"""
     try:
-        from database import db
         user_id = str(user["_id"])
-        print(f"Getting settings for user ID: {user_id}")
+        logger.debug("Getting settings for user ID: %s", user_id)
         
         # Find user settings
-        settings = db.user_settings.find_one({"user_id": user_id})
+        settings = await asyncio.to_thread(db.user_settings.find_one, {"user_id": user_id})
         
         if not settings:
-            print(f"No settings found for user ID: {user_id}, returning defaults")
+            logger.debug("No settings found for user ID: %s, returning defaults", user_id)
             # Return default settings if none exist
             return UserSettings(
                 user_id=user_id,
@@ -44,39 +50,42 @@ async def get_user_settings(user=Depends(get_current_user)):
         return settings
         
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error retrieving user settings: {str(e)}\n{error_details}")
+        logger.exception("Error retrieving user settings")
         raise HTTPException(status_code=500, detail=f"Error retrieving user settings: {str(e)}")
 
 @router.post("/settings", summary="Create user settings")
 async def create_user_settings(settings_data: UserSettingsCreate, user=Depends(get_current_user)):
     """Create settings for the current user"""
     try:
-        from database import db
         user_id = str(user["_id"])
-        print(f"Creating settings for user ID: {user_id}")
-        
-        # Check if settings already exist
-        existing_settings = db.user_settings.find_one({"user_id": user_id})
-        if existing_settings:
-            raise HTTPException(status_code=400, detail="Settings already exist for this user. Use PUT to update.")
+        logger.debug("Creating settings for user ID: %s", user_id)
         
-        # Create new settings
+        # Create new settings; created_at and updated_at share one timestamp
+        now = datetime.utcnow()
         new_settings = UserSettings(
             _id=str(uuid.uuid4()),
             user_id=user_id,
             preferred_language=settings_data.preferred_language,
             notification_enabled=settings_data.notification_enabled,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            created_at=now,
+            updated_at=now
         )
         
-        # Insert into database
-        settings_dict = new_settings.dict()
-        print(f"Inserting new settings: {settings_dict}")
-        result = db.user_settings.insert_one(settings_dict)
-        print(f"Insert result: {result.inserted_id}")
+        # Insert into database; the unique index on user_id rejects a second settings document,
+        # so existing settings are detected by the insert itself rather than a lookup first.
+        # Without a confirmed index (it failed to build, or the in-memory store is in use) look first
+        if not has_unique_index("user_settings", "user_id"):
+            existing_settings = await asyncio.to_thread(db.user_settings.find_one, {"user_id": user_id})
+            if existing_settings:
+                raise HTTPException(status_code=400, detail="Settings already exist for this user. Use PUT to update.")
+        
+        settings_dict = new_settings.model_dump()
+        logger.debug("Inserting new settings: %s", settings_dict)
+        try:
+            result = await asyncio.to_thread(db.user_settings.insert_one, settings_dict)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Settings already exist for this user. Use PUT to update.")
+        logger.debug("Insert result: %s", result.inserted_id)
         
         return new_settings
         
@@ -84,51 +93,15 @@ async def create_user_settings(settings_data: UserSettingsCreate, user=Depends(g
         # Re-raise HTTP exceptions as-is
         raise e
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error creating user settings: {str(e)}\n{error_details}")
+        logger.exception("Error creating user settings")
         raise HTTPException(status_code=500, detail=f"Error creating user settings: {str(e)}")
 
 @router.put("/settings", summary="Update user settings")
 async def update_user_settings(settings_data: UserSettingsUpdate, user=Depends(get_current_user)):
     """Update settings for the current user"""
     try:
-        from database import db
         user_id = str(user["_id"])
-        print(f"Updating settings for user ID: {user_id}")
-        
-        # Find existing settings
-        existing_settings = db.user_settings.find_one({"user_id": user_id})
-        print(f"Existing settings found: {existing_settings is not None}")
-        
-        if not existing_settings:
-            # Create new settings if none exist
-            settings_id = str(uuid.uuid4())
-            new_settings = UserSettings(
-                _id=settings_id,
-                user_id=user_id,
-                preferred_language=settings_data.preferred_language or "Portuguese",
-                notification_enabled=settings_data.notification_enabled if settings_data.notification_enabled is not None else True,
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow()
-            )
-            
-            settings_dict = new_settings.dict()
-            print(f"Creating new settings during update: {settings_dict}")
-            result = db.user_settings.insert_one(settings_dict)
-            print(f"Insert result: {result.inserted_id}")
-            
-            # Get the newly created settings
-            updated_settings = db.user_settings.find_one({"_id": settings_id})
-            if updated_settings is None:
-                print(f"Warning: Could not find newly created settings with ID {settings_id}")
-                # Return the model we just created as fallback
-                return new_settings
-                
-            if "_id" in updated_settings:
-                updated_settings["_id"] = str(updated_settings["_id"])
-                
-            return updated_settings
+        logger.debug("Updating settings for user ID: %s", user_id)
         
         # Prepare update data
         update_data = {}
@@ -138,19 +111,26 @@ async def update_user_settings(settings_data: UserSettingsUpdate, user=Depends(g
             update_data["notification_enabled"] = settings_data.notification_enabled
         
         # Add updated timestamp
-        update_data["updated_at"] = datetime.utcnow()
+        now = datetime.utcnow()
+        update_data["updated_at"] = now
+        
+        # Settings created by this update get the defaults for any field not given
+        insert_data = {"created_at": now}
+        if "preferred_language" not in update_data:
+            insert_data["preferred_language"] = "Portuguese"
+        if "notification_enabled" not in update_data:
+            insert_data["notification_enabled"] = True
         
-        print(f"Updating settings with data: {update_data}")
+        logger.debug("Updating settings with data: %s", update_data)
         
-        # Update settings
-        update_result = db.user_settings.update_one(
+        # Update the settings, creating them if none exist, and get the result in one round-trip
+        updated_settings = await asyncio.to_thread(
+            db.user_settings.find_one_and_update,
             {"user_id": user_id},
-            {"$set": update_data}
+            {"$set": update_data, "$setOnInsert": insert_data},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
-        print(f"Update result: matched={update_result.matched_count}, modified={update_result.modified_count}")
-        
-        # Get updated settings
-        updated_settings = db.user_settings.find_one({"user_id": user_id})
         if updated_settings is None:
             raise HTTPException(status_code=404, detail="Settings not found after update")
             
@@ -163,7 +143,5 @@ async def update_user_settings(settings_data: UserSettingsUpdate, user=Depends(g
         # Re-raise HTTP exceptions as-is
         raise e
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error updating user settings: {str(e)}\n{error_details}")
+        logger.exception("Error updating user settings")
         raise HTTPException(status_code=500, detail=f"Error updating user settings: {str(e)}")